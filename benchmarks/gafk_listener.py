@@ -0,0 +1,281 @@
+"""Replay synthetic message streams through AwayFromKeyboard.on_message_without_command.
+
+Run from the repository root with Red-DiscordBot installed::
+
+    python -m benchmarks.gafk_listener
+    python -m benchmarks.gafk_listener --messages 20000 --mentions 0 5 20 --afk 0.01 0.5
+    python -m benchmarks.gafk_listener --backend redis
+
+Config (and, with ``--backend redis``, the Redis client) is replaced by an in-memory
+stand-in that counts every call, and channel sends are no-ops, so the numbers measure
+the listener itself.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Sequence
+from unittest import mock
+
+from gafk import DEFAULT_GLOBAL, DEFAULT_GUILD, DEFAULT_USER, AwayFromKeyboard
+from gafk.backends import RedisBackend
+
+
+class _Value:
+    def __init__(self, config: MemoryConfig, store: Dict[str, Any], key: str, default: Any):
+        self._config = config
+        self._store = store
+        self._key = key
+        self._default = default
+
+    async def __call__(self) -> Any:
+        self._config.reads += 1
+        return self._store.get(self._key, self._default)
+
+    async def set(self, value: Any) -> None:
+        self._config.writes += 1
+        self._store[self._key] = value
+
+    async def clear(self) -> None:
+        self._config.writes += 1
+        self._store.pop(self._key, None)
+
+
+class _Group:
+    def __init__(self, config: MemoryConfig, store: Dict[int, Dict[str, Any]], key: int, defaults):
+        self._config = config
+        self._store = store
+        self._key = key
+        self._defaults = defaults
+
+    def __getattr__(self, name: str) -> _Value:
+        return _Value(
+            self._config, self._store.setdefault(self._key, {}), name, self._defaults[name]
+        )
+
+    async def all(self) -> Dict[str, Any]:
+        self._config.reads += 1
+        return {**self._defaults, **self._store.get(self._key, {})}
+
+    async def set(self, value: Dict[str, Any]) -> None:
+        self._config.writes += 1
+        self._store[self._key] = dict(value)
+
+    async def clear(self) -> None:
+        self._config.writes += 1
+        self._store.pop(self._key, None)
+
+
+class MemoryConfig:
+    """Just enough of ``redbot.core.Config`` for the AFK cog, counting reads and writes."""
+
+    def __init__(self):
+        self.reads = 0
+        self.writes = 0
+        self.users: Dict[int, Dict[str, Any]] = {}
+        self.guilds: Dict[int, Dict[str, Any]] = {}
+        self.globals: Dict[str, Any] = {}
+
+    def register_user(self, **defaults) -> None:
+        pass
+
+    def register_guild(self, **defaults) -> None:
+        pass
+
+    def register_global(self, **defaults) -> None:
+        pass
+
+    def __getattr__(self, name: str) -> _Value:
+        return _Value(self, self.globals, name, DEFAULT_GLOBAL[name])
+
+    def user_from_id(self, user_id: int) -> _Group:
+        return _Group(self, self.users, user_id, DEFAULT_USER)
+
+    def user(self, user) -> _Group:
+        return self.user_from_id(user.id)
+
+    def guild(self, guild) -> _Group:
+        return _Group(self, self.guilds, guild.id, DEFAULT_GUILD)
+
+    async def all_users(self) -> Dict[int, Dict[str, Any]]:
+        self.reads += 1
+        return {k: {**DEFAULT_USER, **v} for k, v in self.users.items()}
+
+    async def all_guilds(self) -> Dict[int, Dict[str, Any]]:
+        self.reads += 1
+        return {k: {**DEFAULT_GUILD, **v} for k, v in self.guilds.items()}
+
+
+class MemoryRedis:
+    """The few Redis commands RedisBackend uses, counting round trips."""
+
+    def __init__(self):
+        self.calls = 0
+        self.data: Dict[str, str] = {}
+
+    async def mget(self, keys: List[str]) -> List[Optional[str]]:
+        self.calls += 1
+        return [self.data.get(key) for key in keys]
+
+    async def set(self, key: str, value: str, ex: Optional[int] = None) -> None:
+        self.calls += 1
+        self.data[key] = value
+
+    async def getdel(self, key: str) -> Optional[str]:
+        self.calls += 1
+        return self.data.pop(key, None)
+
+    async def aclose(self) -> None:
+        pass
+
+
+class _Channel:
+    def __init__(self, channel_id: int):
+        self.id = channel_id
+        self.sent = 0
+
+    async def send(self, *args, **kwargs) -> None:
+        self.sent += 1
+
+
+def _user(user_id: int) -> SimpleNamespace:
+    return SimpleNamespace(id=user_id, bot=False, mention=f"<@{user_id}>")
+
+
+def _messages(
+    count: int, mentions: int, users: int, channels: Sequence[_Channel], seed: int
+) -> List[SimpleNamespace]:
+    rng = random.Random(seed)
+    guild = SimpleNamespace(id=1)
+    messages = []
+    for _ in range(count):
+        messages.append(
+            SimpleNamespace(
+                author=_user(rng.randrange(users)),
+                mentions=[_user(rng.randrange(users)) for _ in range(mentions)],
+                role_mentions=[],
+                reference=None,
+                guild=guild,
+                channel=rng.choice(channels),
+                to_reference=lambda **kwargs: None,
+            )
+        )
+    return messages
+
+
+async def run_scenario(
+    *,
+    messages: int,
+    mentions: int,
+    afk_fraction: float,
+    rate: Optional[float],
+    backend: str = "config",
+    users: int = 10_000,
+    channels: int = 50,
+    seed: int = 0,
+) -> Dict[str, float]:
+    config = MemoryConfig()
+    rng = random.Random(seed)
+    for user_id in range(users):
+        if rng.random() < afk_fraction:
+            config.users[user_id] = {
+                **DEFAULT_USER,
+                "afk": True,
+                "reason": "benchmarking",
+                "timestamp": 1_600_000_000,
+            }
+
+    async def get_shared_api_tokens(service_name: str) -> Dict[str, str]:
+        return {}
+
+    bot = SimpleNamespace(
+        loop=asyncio.get_running_loop(), get_shared_api_tokens=get_shared_api_tokens
+    )
+    with mock.patch("gafk.RedDB.get_conf", return_value=config):
+        cog = AwayFromKeyboard(bot)
+    await cog.initialize()
+    redis = MemoryRedis()
+    if backend == "redis":
+        await cog.backend.close()
+        cog.backend = RedisBackend(redis, stats=cog.stats)
+        for user_id, data in config.users.items():
+            if data["afk"]:
+                await cog.backend.set(user_id, (data["reason"], data["timestamp"], None))
+        redis.calls = 0
+    fake_channels = [_Channel(i) for i in range(channels)]
+    stream = _messages(messages, mentions, users, fake_channels, seed)
+    config.reads = config.writes = 0
+
+    latencies: List[float] = []
+    interval = 1 / rate if rate else 0.0
+    started = time.perf_counter()
+    for idx, message in enumerate(stream):
+        if interval:
+            delay = started + idx * interval - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        before = time.perf_counter()
+        await cog.on_message_without_command(message)
+        latencies.append(time.perf_counter() - before)
+    elapsed = time.perf_counter() - started
+    await cog.cog_unload()
+
+    latencies.sort()
+    return {
+        "msgs_per_sec": messages / elapsed,
+        "p50_us": statistics.median(latencies) * 1e6,
+        "p99_us": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1e6,
+        "store_calls_per_msg": (config.reads + config.writes + redis.calls) / messages,
+        "sends_per_msg": sum(c.sent for c in fake_channels) / messages,
+    }
+
+
+async def main(args: argparse.Namespace) -> None:
+    header = f"{'mentions':>8} {'afk':>6} {'rate':>8} {'msg/s':>10} {'p50 us':>9} {'p99 us':>9} {'store/msg':>9} {'send/msg':>8}"
+    print(header)
+    print("-" * len(header))
+    for mentions in args.mentions:
+        for afk_fraction in args.afk:
+            for rate in args.rate:
+                result = await run_scenario(
+                    messages=args.messages,
+                    mentions=mentions,
+                    afk_fraction=afk_fraction,
+                    rate=rate or None,
+                    backend=args.backend,
+                    users=args.users,
+                    seed=args.seed,
+                )
+                print(
+                    f"{mentions:>8} {afk_fraction:>6.2f} {rate or 'max':>8} "
+                    f"{result['msgs_per_sec']:>10.0f} {result['p50_us']:>9.1f} "
+                    f"{result['p99_us']:>9.1f} {result['store_calls_per_msg']:>9.3f} "
+                    f"{result['sends_per_msg']:>8.3f}"
+                )
+
+
+def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=5000, help="messages per scenario")
+    parser.add_argument("--users", type=int, default=10_000, help="distinct user ids")
+    parser.add_argument("--mentions", type=int, nargs="+", default=[0, 1, 5, 20])
+    parser.add_argument("--afk", type=float, nargs="+", default=[0.01, 0.1, 0.5])
+    parser.add_argument(
+        "--rate",
+        type=float,
+        nargs="+",
+        default=[0],
+        help="messages/sec, 0 for as fast as possible",
+    )
+    parser.add_argument("--backend", choices=("config", "redis"), default="config")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,219 @@
+"""Run the global ban and unban fan-out against thousands of fake guilds.
+
+Run from the repository root with Red-DiscordBot installed::
+
+    python -m benchmarks.globalban_fanout
+    python -m benchmarks.globalban_fanout --guilds 5000 --latency 0.05 --rate 50
+    python -m benchmarks.globalban_fanout --strategies fanout snapshot --concurrency 5 20 50
+
+Every ``guild.ban``/``guild.unban`` goes through a local stand-in for Discord's HTTP
+layer that adds latency, answers with 429 and ``Retry-After`` once more than
+``--rate`` requests were made in the last second, fails a share of requests with a
+5xx and answers 403 in guilds where the bot lacks ``ban_members``.
+
+Strategies:
+
+* ``sequential``: one guild after the other, as globalban used to do.
+* ``fanout``: ``globalban.fanout.fan_out``, concurrent with retries.
+* ``snapshot``: ``fan_out`` after skipping guilds the capability snapshot rules out.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import collections
+import random
+import time
+from types import SimpleNamespace
+from typing import Any, Deque, Dict, List, Optional, Sequence
+
+import discord
+
+from globalban.capability import CapabilitySnapshot
+from globalban.fanout import fan_out
+
+STRATEGIES = ("sequential", "fanout", "snapshot")
+
+
+class _Response:
+    def __init__(self, status: int, headers: Optional[Dict[str, str]] = None):
+        self.status = status
+        self.reason = "benchmark"
+        self.headers = headers or {}
+
+
+class FakeDiscordAPI:
+    """Stand-in for the ban endpoints with latency, a global rate limit and errors."""
+
+    def __init__(self, *, latency: float, rate: int, error_rate: float, seed: int):
+        self.latency = latency
+        self.rate = rate
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self._recent: Deque[float] = collections.deque()
+        self.requests = 0
+        self.rate_limited = 0
+        self.server_errors = 0
+        self.forbidden = 0
+
+    async def request(self, guild: FakeGuild) -> None:
+        self.requests += 1
+        # latency is jittered by +-50% like a real round trip
+        await asyncio.sleep(self.latency * (0.5 + self.rng.random()))
+        now = time.monotonic()
+        while self._recent and self._recent[0] <= now - 1:
+            self._recent.popleft()
+        if len(self._recent) >= self.rate:
+            self.rate_limited += 1
+            retry_after = self._recent[0] + 1 - now
+            raise discord.HTTPException(
+                _Response(429, {"Retry-After": f"{retry_after:.3f}"}), "rate limited"
+            )
+        self._recent.append(now)
+        if not guild.can_ban:
+            self.forbidden += 1
+            raise discord.Forbidden(_Response(403), "Missing Permissions")
+        if self.rng.random() < self.error_rate:
+            self.server_errors += 1
+            raise discord.HTTPException(_Response(503), "Service Unavailable")
+
+
+class FakeGuild:
+    def __init__(self, guild_id: int, shard_id: int, can_ban: bool, api: FakeDiscordAPI):
+        self.id = guild_id
+        self.name = f"guild-{guild_id}"
+        self.shard_id = shard_id
+        self.owner_id = 0
+        self.can_ban = can_ban
+        self.me = SimpleNamespace(
+            guild_permissions=SimpleNamespace(ban_members=can_ban),
+            top_role=SimpleNamespace(position=10),
+        )
+        self._api = api
+
+    def get_member(self, user_id: int) -> None:
+        return None
+
+    async def ban(self, user: Any, *, reason: Optional[str] = None) -> None:
+        await self._api.request(self)
+
+    async def unban(self, user: Any, *, reason: Optional[str] = None) -> None:
+        await self._api.request(self)
+
+
+async def _sequential(guilds: List[FakeGuild], action: str, user: Any) -> Dict[str, int]:
+    succeeded = failed = 0
+    for guild in guilds:
+        try:
+            await getattr(guild, action)(user, reason="benchmark")
+        except (discord.HTTPException, discord.Forbidden):
+            failed += 1
+        else:
+            succeeded += 1
+    return {"succeeded": succeeded, "failed": failed, "skipped": 0}
+
+
+async def run_scenario(
+    *,
+    strategy: str,
+    action: str,
+    guilds: int,
+    shards: int,
+    latency: float,
+    rate: int,
+    forbidden: float,
+    error_rate: float,
+    concurrency: int,
+    seed: int = 0,
+) -> Dict[str, float]:
+    rng = random.Random(seed)
+    api = FakeDiscordAPI(latency=latency, rate=rate, error_rate=error_rate, seed=seed)
+    fake_guilds = [
+        FakeGuild(guild_id, guild_id % shards, rng.random() >= forbidden, api)
+        for guild_id in range(guilds)
+    ]
+    user = discord.Object(id=1)
+
+    started = time.perf_counter()
+    if strategy == "sequential":
+        counts = await _sequential(fake_guilds, action, user)
+    else:
+        targets, skipped = fake_guilds, []
+        if strategy == "snapshot":
+            targets, skipped = CapabilitySnapshot().split(fake_guilds, user.id)
+        result = await fan_out(
+            targets,
+            lambda guild: getattr(guild, action)(user, reason="benchmark"),
+            concurrency=concurrency,
+        )
+        counts = {
+            "succeeded": len(result.succeeded),
+            "failed": len(result.failed),
+            "skipped": len(skipped),
+        }
+    elapsed = time.perf_counter() - started
+
+    attempted = counts["succeeded"] + counts["failed"]
+    return {
+        "wall_s": elapsed,
+        "requests": api.requests,
+        "retries": api.requests - attempted,
+        "rate_limited": api.rate_limited,
+        "server_errors": api.server_errors,
+        "forbidden": api.forbidden,
+        **counts,
+    }
+
+
+async def main(args: argparse.Namespace) -> None:
+    header = (
+        f"{'strategy':>10} {'action':>6} {'conc':>5} {'wall s':>8} {'requests':>8} "
+        f"{'retries':>7} {'429':>6} {'5xx':>5} {'403':>5} {'ok':>6} {'failed':>6} {'skipped':>7}"
+    )
+    print(header)
+    print("-" * len(header))
+    for action in args.actions:
+        for strategy in args.strategies:
+            # concurrency doesn't apply to the sequential strategy
+            for concurrency in [1] if strategy == "sequential" else args.concurrency:
+                result = await run_scenario(
+                    strategy=strategy,
+                    action=action,
+                    guilds=args.guilds,
+                    shards=args.shards,
+                    latency=args.latency,
+                    rate=args.rate,
+                    forbidden=args.forbidden,
+                    error_rate=args.errors,
+                    concurrency=concurrency,
+                    seed=args.seed,
+                )
+                print(
+                    f"{strategy:>10} {action:>6} {concurrency:>5} {result['wall_s']:>8.2f} "
+                    f"{result['requests']:>8} {result['retries']:>7} "
+                    f"{result['rate_limited']:>6} {result['server_errors']:>5} "
+                    f"{result['forbidden']:>5} {result['succeeded']:>6} "
+                    f"{result['failed']:>6} {result['skipped']:>7}"
+                )
+
+
+def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--guilds", type=int, default=2000)
+    parser.add_argument("--shards", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.02, help="mean seconds per request")
+    parser.add_argument("--rate", type=int, default=50, help="requests/sec before 429s")
+    parser.add_argument(
+        "--forbidden", type=float, default=0.1, help="share of guilds without ban_members"
+    )
+    parser.add_argument("--errors", type=float, default=0.01, help="share of requests with 5xx")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[20])
+    parser.add_argument("--strategies", choices=STRATEGIES, nargs="+", default=list(STRATEGIES))
+    parser.add_argument("--actions", choices=("ban", "unban"), nargs="+", default=["ban", "unban"])
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
@@ -1,7 +1,10 @@
 from __future__ import annotations
 
 import datetime
-from typing import Any, Dict, Optional
+import time
+from collections import OrderedDict
+from logging import getLogger
+from typing import Any, Dict, List, Optional, Tuple
 
 import discord
 from redbot.core import Config as RedDB
@@ -10,10 +13,28 @@ from redbot.core.bot import Red
 from redbot.core.commands import Cog as RedCog
 from redbot.core.utils.chat_formatting import humanize_timedelta
 
+from .backends import AFKBackend, BackendGate, ConfigBackend, RedisBackend
+from .stats import ListenerStats
+
+log = getLogger("red.dia.AwayFromKeyboard")
+
+# members of a pinged role are only checked for AFK statuses when the role is this small
+ROLE_MENTION_LIMIT: int = 25
+
 DEFAULT_USER: Dict[str, Any] = {
     "afk": False,
     "reason": None,
     "timestamp": None,
+    "expires": None,
+    "max_duration": None,
+}
+
+DEFAULT_GUILD: Dict[str, Any] = {
+    "max_duration": None,
+}
+
+DEFAULT_GLOBAL: Dict[str, Any] = {
+    "notice_cooldown": 60,
 }
 
 
@@ -24,16 +45,138 @@ class AwayFromKeyboard(RedCog):
         self.bot: Red = bot
         self.db: RedDB = RedDB.get_conf(self, identifier=126875360, force_registration=True)
         self.db.register_user(**DEFAULT_USER)
+        self.db.register_guild(**DEFAULT_GUILD)
+        self.db.register_global(**DEFAULT_GLOBAL)
+        # maximum AFK durations in seconds, by user id and by guild id
+        self._user_limits: Dict[int, int] = {}
+        self._guild_limits: Dict[int, int] = {}
+        self.stats: ListenerStats = ListenerStats()
+        self.backend: AFKBackend = ConfigBackend(self.db, self._user_limits, stats=self.stats)
+        # held by everything that reads or writes AFK statuses, so a backend switch loses nothing
+        self._backend_gate: BackendGate = BackendGate()
+        # (channel id, afk user id) -> monotonic time until which the notice is not repeated
+        self._notified: OrderedDict[Tuple[int, int], float] = OrderedDict()
+        self._notice_cooldown: int = DEFAULT_GLOBAL["notice_cooldown"]
+
+    if discord.version_info.major >= 2:
+
+        async def cog_unload(self) -> None:
+            await self.backend.close()
+
+    else:
+
+        def cog_unload(self) -> None:
+            self.bot.loop.create_task(self.backend.close())
+
+    async def initialize(self) -> None:
+        self._notice_cooldown = await self.db.notice_cooldown()
+        for guild_id, data in (await self.db.all_guilds()).items():
+            if data["max_duration"]:
+                self._guild_limits[int(guild_id)] = data["max_duration"]
+        for user_id, data in (await self.db.all_users()).items():
+            if data["max_duration"]:
+                self._user_limits[int(user_id)] = data["max_duration"]
+        self.backend = await self._make_backend(await self.bot.get_shared_api_tokens("gafk_redis"))
+        await self.backend.load()
+
+    async def _make_backend(self, tokens: Dict[str, str]) -> AFKBackend:
+        if tokens.get("url"):
+            try:
+                return RedisBackend.from_url(tokens["url"], stats=self.stats)
+            except (RuntimeError, ValueError) as e:
+                log.error("Couldn't use the Redis backend, falling back to Config: %s", e)
+        return ConfigBackend(self.db, self._user_limits, stats=self.stats)
+
+    @commands.Cog.listener()
+    async def on_red_api_tokens_update(self, service_name: str, api_tokens: Dict[str, str]):
+        if service_name != "gafk_redis":
+            return
+        async with self._backend_gate.replace():
+            backend = await self._make_backend(api_tokens)
+            old = self.backend
+            if old.same_store(backend):
+                # the old backend flushes its pending writes on close, the new one loads them
+                await old.close()
+                await backend.load()
+            else:
+                await backend.load()
+                try:
+                    await self._migrate(old, backend)
+                except Exception:
+                    # keep the old backend, it still holds every status
+                    await backend.close()
+                    raise
+                await old.close()
+            self.backend = backend
+
+    @staticmethod
+    async def _migrate(old: AFKBackend, new: AFKBackend) -> None:
+        """Move every AFK status to the new store, leaving the old one empty."""
+        entries = await old.entries()
+        # anything else the new store holds is left over from the last time it was used
+        for user_id in (await new.entries()).keys() - entries.keys():
+            await new.clear(user_id)
+        for user_id, entry in entries.items():
+            await new.set(user_id, entry)
+        # so switching back later doesn't bring back statuses that ended meanwhile
+        for user_id in entries:
+            await old.clear(user_id)
+        log.info("Moved %s AFK statuses to the %s.", len(entries), type(new).__name__)
+
+    def get_listener_stats(self) -> Dict[str, Any]:
+        """Counters and wall times of the message listener since load or the last reset.
+
+        ``counters`` holds ``invocations``, ``early_exits`` (messages that needed no reply),
+        ``store_reads``/``store_writes`` (round trips to the AFK backend) and ``messages_sent``.
+        """
+        return {"backend": type(self.backend).__name__, **self.stats.snapshot()}
+
+    def _should_notify(self, channel_id: int, user_id: int, now: float) -> bool:
+        # every entry gets the same cooldown, so insertion order is also expiry order
+        while self._notified and next(iter(self._notified.values())) <= now:
+            self._notified.popitem(last=False)
+        return (channel_id, user_id) not in self._notified
+
+    def _mark_notified(self, channel_id: int, user_id: int, now: float) -> None:
+        self._notified[(channel_id, user_id)] = now + self._notice_cooldown
+
+    @staticmethod
+    def _mentioned_ids(message: discord.Message) -> List[int]:
+        """IDs of the users a message mentions, replies to or pings through a small role."""
+        user_ids = dict.fromkeys(mention.id for mention in message.mentions)
+        reference = message.reference
+        if reference is not None and isinstance(reference.resolved, discord.Message):
+            user_ids[reference.resolved.author.id] = None
+        for role in message.role_mentions:
+            members = role.members
+            if len(members) <= ROLE_MENTION_LIMIT:
+                user_ids.update(dict.fromkeys(member.id for member in members))
+        user_ids.pop(message.author.id, None)
+        return list(user_ids)
 
     @commands.command(aliases=["away"])
     @commands.guild_only()
     @commands.cooldown(1, 5, commands.BucketType.user)
     async def afk(self, ctx: commands.Context, *, reason: Optional[str] = None) -> None:
         """Set your status to AFK."""
-        async with self.db.user(ctx.author).all() as data:
-            data["afk"] = True
-            data["reason"] = reason if reason else "No reason provided."
-            data["timestamp"] = int(datetime.datetime.now(datetime.timezone.utc).timestamp())
+        timestamp = int(datetime.datetime.now(datetime.timezone.utc).timestamp())
+        limits = [
+            limit
+            for limit in (
+                self._user_limits.get(ctx.author.id),
+                self._guild_limits.get(ctx.guild.id),
+            )
+            if limit
+        ]
+        async with self._backend_gate.use():
+            await self.backend.set(
+                ctx.author.id,
+                (
+                    reason if reason else "No reason provided.",
+                    timestamp,
+                    timestamp + min(limits) if limits else None,
+                ),
+            )
         embed = discord.Embed()
         embed.color = 0x2F3136
         embed.description = "> You are now AFK."
@@ -41,21 +184,38 @@ class AwayFromKeyboard(RedCog):
 
     @commands.Cog.listener()
     async def on_message_without_command(self, message: discord.Message):
+        started = time.perf_counter()
+        self.stats.incr("invocations")
+        try:
+            await self._handle_message(message)
+        finally:
+            self.stats.observe(time.perf_counter() - started)
+
+    async def _handle_message(self, message: discord.Message) -> None:
         if message.author.bot:
+            self.stats.incr("early_exits")
             return
-        adata = await self.db.user(message.author).all()
-        if adata["afk"]:
-            async with self.db.user(message.author).all() as new_data:
-                new_data["afk"] = False
-                new_data["reason"] = None
-                new_data["timestamp"] = None
+        mentioned = self._mentioned_ids(message)
+        async with self._backend_gate.use():
+            states = await self.backend.get_many([message.author.id, *mentioned])
+            if not states:
+                self.stats.incr("early_exits")
+                return
+            # another cluster may have welcomed them back already, only the one that clears it does
+            entry = (
+                await self.backend.clear(message.author.id)
+                if message.author.id in states
+                else None
+            )
+        if entry is not None:
+            _, timestamp, _ = entry
             embed = discord.Embed(color=0x2F3136)
             description = "{}: welcome back, you were away for **{}**".format(
                 message.author.mention,
                 humanize_timedelta(
                     timedelta=(
                         datetime.datetime.now(datetime.timezone.utc)
-                        - datetime.datetime.utcfromtimestamp(adata["timestamp"]).replace(
+                        - datetime.datetime.utcfromtimestamp(timestamp).replace(
                             tzinfo=datetime.timezone.utc
                         )
                     )
@@ -68,26 +228,144 @@ class AwayFromKeyboard(RedCog):
                 delete_after=15,
                 mention_author=False,
             )
-        if not message.mentions:
-            return
-        for mention in message.mentions:
-            data = await self.db.user(mention).all()
-            if not data["afk"]:
+            self.stats.incr("messages_sent")
+        now = time.monotonic()
+        description = ""
+        for user_id in mentioned:
+            if user_id not in states:
                 continue
-            embed = discord.Embed(color=0x2F3136)
-            embed.description = "{} is AFK: **{}** - <t:{}:R>".format(
-                mention.mention,
-                data["reason"] or "No reason provided.",
-                data["timestamp"],
-            )
-            await message.channel.send(
-                embed=embed,
-                reference=message.to_reference(fail_if_not_exists=False),
-                delete_after=15,
-                mention_author=False,
-            )
+            if not self._should_notify(message.channel.id, user_id, now):
+                continue
+            reason, timestamp, _ = states[user_id]
+            line = "<@{}> is AFK: **{}** - <t:{}:R>".format(user_id, reason, timestamp)
+            if len(description) + len(line) > 4000:
+                break
+            description += line + "\n"
+            # users cut from this notice are still announced by the next message
+            self._mark_notified(message.channel.id, user_id, now)
+        if not description:
+            return
+        embed = discord.Embed(color=0x2F3136)
+        embed.description = description
+        await message.channel.send(
+            embed=embed,
+            reference=message.to_reference(fail_if_not_exists=False),
+            delete_after=15,
+            mention_author=False,
+        )
+        self.stats.incr("messages_sent")
+
+    @commands.group()
+    async def afkset(self, ctx: commands.Context) -> None:
+        """Manage AFK settings.
+
+        AFK statuses are stored in this cog's Config. To share them between several bot
+        processes, install the `redis` package and point the cog at a Redis server with
+        `[p]set api gafk_redis url,redis://host:6379/0`. Current AFK statuses move along
+        whenever the store changes.
+        """
+
+    @afkset.command(name="maxduration")
+    @commands.guild_only()
+    @commands.admin_or_permissions(manage_guild=True)
+    async def afkset_maxduration(
+        self,
+        ctx: commands.Context,
+        *,
+        duration: Optional[
+            commands.TimedeltaConverter(minimum=datetime.timedelta(minutes=1))
+        ] = None,
+    ) -> None:
+        """Set how long AFK statuses set in this server last at most.
+
+        Leave the duration empty to let them last until the user speaks again.
+        """
+        if duration is None:
+            self._guild_limits.pop(ctx.guild.id, None)
+            await self.db.guild(ctx.guild).max_duration.clear()
+            await ctx.send("AFK statuses set in this server no longer expire.")
+            return
+        seconds = int(duration.total_seconds())
+        self._guild_limits[ctx.guild.id] = seconds
+        await self.db.guild(ctx.guild).max_duration.set(seconds)
+        await ctx.send(
+            f"AFK statuses set in this server now expire after {humanize_timedelta(timedelta=duration)}."
+        )
+
+    @afkset.command(name="mymax")
+    async def afkset_mymax(
+        self,
+        ctx: commands.Context,
+        *,
+        duration: Optional[
+            commands.TimedeltaConverter(minimum=datetime.timedelta(minutes=1))
+        ] = None,
+    ) -> None:
+        """Set how long your AFK status lasts at most.
+
+        Leave the duration empty to keep it until you speak again.
+        """
+        if duration is None:
+            self._user_limits.pop(ctx.author.id, None)
+            await self.db.user(ctx.author).max_duration.clear()
+            await ctx.send("Your AFK status no longer expires.")
+            return
+        seconds = int(duration.total_seconds())
+        self._user_limits[ctx.author.id] = seconds
+        await self.db.user(ctx.author).max_duration.set(seconds)
+        await ctx.send(
+            f"Your AFK status now expires after {humanize_timedelta(timedelta=duration)}."
+        )
+
+    @afkset.command(name="cooldown")
+    @commands.is_owner()
+    async def afkset_cooldown(self, ctx: commands.Context, seconds: int) -> None:
+        """Set how long to wait before repeating an AFK notice for the same user in a channel.
+
+        Use `0` to always send the notice.
+        """
+        if seconds < 0:
+            await ctx.send("The cooldown can't be negative.")
+            return
+        await self.db.notice_cooldown.set(seconds)
+        self._notice_cooldown = seconds
+        self._notified.clear()
+        await ctx.send(f"AFK notices will now be repeated at most every {seconds} seconds.")
+
+    @afkset.command(name="stats")
+    @commands.is_owner()
+    async def afkset_stats(self, ctx: commands.Context, reset: bool = False) -> None:
+        """Show how much work the AFK message listener does.
+
+        Pass `true` to reset the numbers afterwards.
+        """
+        data = self.get_listener_stats()
+        counters = data["counters"]
+        latency = {
+            k: v * 1000 for k, v in data["latency"].items() if k in ("mean", "p50", "p99", "max")
+        }
+        invocations = counters.get("invocations", 0)
+        reads = counters.get("store_reads", 0)
+        writes = counters.get("store_writes", 0)
+        embed = discord.Embed(color=0x2F3136, title="AFK listener stats")
+        embed.description = (
+            f"Backend: `{data['backend']}`\n"
+            f"Since: <t:{int(data['since'])}:R>\n"
+            f"Messages handled: **{invocations}**\n"
+            f"Early exits: **{counters.get('early_exits', 0)}**\n"
+            f"Store reads/writes: **{reads}**/**{writes}** "
+            f"({(reads + writes) / (invocations or 1):.3f} per message)\n"
+            f"Messages sent: **{counters.get('messages_sent', 0)}**\n"
+            f"Wall time: mean **{latency['mean']:.3f}ms**, p50 ≤ **{latency['p50']:.2f}ms**, "
+            f"p99 ≤ **{latency['p99']:.2f}ms**, max **{latency['max']:.2f}ms**, "
+            f"total **{data['latency']['total']:.2f}s**"
+        )
+        await ctx.send(embed=embed)
+        if reset:
+            self.stats.reset()
 
 
 async def setup(bot: Red):
     cog = AwayFromKeyboard(bot)
     await discord.utils.maybe_coroutine(bot.add_cog, cog)
+    await cog.initialize()
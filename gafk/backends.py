@@ -0,0 +1,306 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import json
+import time
+from contextlib import asynccontextmanager
+from logging import getLogger
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+from redbot.core import Config
+
+from .stats import ListenerStats
+
+try:
+    from redis import asyncio as aioredis
+except ImportError:
+    aioredis = None
+
+log = getLogger("red.dia.AwayFromKeyboard")
+
+# reason, timestamp, expires
+AFKEntry = Tuple[str, int, Optional[int]]
+
+# pending AFK changes are written to Config every FLUSH_INTERVAL seconds,
+# at most FLUSH_BATCH_SIZE users per flush
+FLUSH_INTERVAL: int = 5
+FLUSH_BATCH_SIZE: int = 50
+
+
+class AFKBackend:
+    """Where AFK statuses are stored.
+
+    Lookups take every user ID a message needs at once, so backends that live
+    behind the network can answer them in a single round trip.
+    """
+
+    stats: ListenerStats
+
+    async def load(self) -> None:
+        """Prepare the backend, called once when the cog loads."""
+
+    async def close(self) -> None:
+        """Write out anything still pending and stop background work."""
+
+    def same_store(self, other: AFKBackend) -> bool:
+        """Whether both backends read and write the same statuses."""
+        return False
+
+    async def entries(self) -> Dict[int, AFKEntry]:
+        """Every AFK status in the store, used when switching to another backend."""
+        raise NotImplementedError
+
+    async def get_many(self, user_ids: Iterable[int]) -> Dict[int, AFKEntry]:
+        """Return the AFK entries of the given users that are currently AFK."""
+        raise NotImplementedError
+
+    async def set(self, user_id: int, entry: AFKEntry) -> None:
+        raise NotImplementedError
+
+    async def clear(self, user_id: int) -> Optional[AFKEntry]:
+        """Clear a user's AFK status and return the entry it had, if any."""
+        raise NotImplementedError
+
+
+class ConfigBackend(AFKBackend):
+    """Stores AFK statuses in the cog's Config.
+
+    Every AFK user is kept in memory, changes are written back to Config in
+    batches and expired statuses are cleared from a deadline heap.
+    """
+
+    def __init__(
+        self,
+        config: Config,
+        user_limits: Dict[int, int],
+        *,
+        stats: Optional[ListenerStats] = None,
+    ):
+        self.config: Config = config
+        self.stats = stats if stats is not None else ListenerStats()
+        # the cog's user id -> max duration map, written alongside the AFK fields
+        self.user_limits: Dict[int, int] = user_limits
+        # user id -> (reason, timestamp, expires) for everyone currently AFK
+        self._afk: Dict[int, AFKEntry] = {}
+        # user id -> new entry, or None when the AFK status was cleared
+        self._pending_writes: Dict[int, Optional[AFKEntry]] = {}
+        # min-heap of (expires, user id), entries whose AFK status changed since are skipped
+        self._expiry_heap: List[Tuple[int, int]] = []
+        self._expiry_wakeup: asyncio.Event = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+
+    async def load(self) -> None:
+        self.stats.incr("store_reads")
+        for user_id, data in (await self.config.all_users()).items():
+            if data["afk"]:
+                self._afk[int(user_id)] = (
+                    data["reason"] or "No reason provided.",
+                    data["timestamp"],
+                    data["expires"],
+                )
+                if data["expires"] is not None:
+                    heapq.heappush(self._expiry_heap, (data["expires"], int(user_id)))
+        self._tasks = [
+            asyncio.create_task(self._flush_loop()),
+            asyncio.create_task(self._expiry_loop()),
+        ]
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        # a flush cancelled mid-batch puts its entries back once it has actually stopped
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self.flush()
+
+    def same_store(self, other: AFKBackend) -> bool:
+        return isinstance(other, ConfigBackend) and other.config is self.config
+
+    async def entries(self) -> Dict[int, AFKEntry]:
+        return dict(self._afk)
+
+    async def get_many(self, user_ids: Iterable[int]) -> Dict[int, AFKEntry]:
+        return {user_id: self._afk[user_id] for user_id in user_ids if user_id in self._afk}
+
+    async def set(self, user_id: int, entry: AFKEntry) -> None:
+        self._afk[user_id] = entry
+        self._pending_writes[user_id] = entry
+        expires = entry[2]
+        if expires is not None:
+            if not self._expiry_heap or expires < self._expiry_heap[0][0]:
+                self._expiry_wakeup.set()
+            heapq.heappush(self._expiry_heap, (expires, user_id))
+
+    async def clear(self, user_id: int) -> Optional[AFKEntry]:
+        entry = self._afk.pop(user_id, None)
+        if entry is not None:
+            self._pending_writes[user_id] = None
+        return entry
+
+    async def _expiry_loop(self) -> None:
+        while True:
+            self._expiry_wakeup.clear()
+            now = int(time.time())
+            expired: List[int] = []
+            while self._expiry_heap and self._expiry_heap[0][0] <= now:
+                expires, user_id = heapq.heappop(self._expiry_heap)
+                entry = self._afk.get(user_id)
+                if entry is not None and entry[2] == expires:
+                    expired.append(user_id)
+            for user_id in expired:
+                await self.clear(user_id)
+            if expired:
+                log.debug("Cleared %s expired AFK statuses.", len(expired))
+            timeout = self._expiry_heap[0][0] - now if self._expiry_heap else None
+            try:
+                await asyncio.wait_for(self._expiry_wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            try:
+                await self.flush(FLUSH_BATCH_SIZE)
+            except Exception:
+                log.exception("Failed to write pending AFK changes.")
+
+    async def flush(self, limit: Optional[int] = None) -> None:
+        """Write pending AFK changes to Config, oldest first."""
+        batch = list(self._pending_writes.items())[:limit]
+        for user_id, _ in batch:
+            del self._pending_writes[user_id]
+        for idx, (user_id, entry) in enumerate(batch):
+            group = self.config.user_from_id(user_id)
+            self.stats.incr("store_writes")
+            try:
+                if entry is None and user_id not in self.user_limits:
+                    await group.clear()
+                else:
+                    await group.set(self._user_record(user_id, entry))
+            except (Exception, asyncio.CancelledError):
+                # retry on the next flush unless the user changed state in the meantime
+                for retry_id, retry_entry in batch[idx:]:
+                    self._pending_writes.setdefault(retry_id, retry_entry)
+                raise
+
+    def _user_record(self, user_id: int, entry: Optional[AFKEntry]) -> Dict[str, Any]:
+        record = {
+            "afk": False,
+            "reason": None,
+            "timestamp": None,
+            "expires": None,
+            "max_duration": self.user_limits.get(user_id),
+        }
+        if entry is not None:
+            record.update(afk=True, reason=entry[0], timestamp=entry[1], expires=entry[2])
+        return record
+
+
+class RedisBackend(AFKBackend):
+    """Stores AFK statuses in a Redis-protocol key-value store shared by every cluster.
+
+    Each AFK user is one key holding a JSON list, so a message costs a single
+    ``MGET`` and expiry is left to the store's own key TTLs.
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        *,
+        prefix: str = "gafk:afk:",
+        url: Optional[str] = None,
+        stats: Optional[ListenerStats] = None,
+    ):
+        self.client = client
+        self.prefix: str = prefix
+        # where the client connects to, when known
+        self.url: Optional[str] = url
+        self.stats = stats if stats is not None else ListenerStats()
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs) -> RedisBackend:
+        if aioredis is None:
+            raise RuntimeError("The redis package is required to use a Redis backend.")
+        return cls(aioredis.from_url(url, decode_responses=True), url=url, **kwargs)
+
+    async def close(self) -> None:
+        close = getattr(self.client, "aclose", None) or self.client.close
+        await close()
+
+    def same_store(self, other: AFKBackend) -> bool:
+        return (
+            isinstance(other, RedisBackend)
+            and self.url is not None
+            and other.url == self.url
+            and other.prefix == self.prefix
+        )
+
+    async def entries(self) -> Dict[int, AFKEntry]:
+        self.stats.incr("store_reads")
+        user_ids = [
+            int(key[len(self.prefix) :])
+            async for key in self.client.scan_iter(match=self.prefix + "*")
+        ]
+        return await self.get_many(user_ids)
+
+    async def get_many(self, user_ids: Iterable[int]) -> Dict[int, AFKEntry]:
+        user_ids = list(user_ids)
+        if not user_ids:
+            return {}
+        self.stats.incr("store_reads")
+        values = await self.client.mget([self.prefix + str(user_id) for user_id in user_ids])
+        return {
+            user_id: tuple(json.loads(value))
+            for user_id, value in zip(user_ids, values)
+            if value is not None
+        }
+
+    async def set(self, user_id: int, entry: AFKEntry) -> None:
+        ttl = None
+        if entry[2] is not None:
+            ttl = max(1, entry[2] - int(time.time()))
+        self.stats.incr("store_writes")
+        await self.client.set(self.prefix + str(user_id), json.dumps(entry), ex=ttl)
+
+    async def clear(self, user_id: int) -> Optional[AFKEntry]:
+        self.stats.incr("store_writes")
+        value = await self.client.getdel(self.prefix + str(user_id))
+        if value is None:
+            return None
+        return tuple(json.loads(value))
+
+
+class BackendGate:
+    """Lets any number of callers use the AFK backend at once, but none while it's replaced."""
+
+    def __init__(self):
+        self._users: int = 0
+        self._idle: asyncio.Event = asyncio.Event()
+        self._idle.set()
+        self._open: asyncio.Event = asyncio.Event()
+        self._open.set()
+        self._replacing: asyncio.Lock = asyncio.Lock()
+
+    @asynccontextmanager
+    async def use(self) -> AsyncIterator[None]:
+        await self._open.wait()
+        self._users += 1
+        self._idle.clear()
+        try:
+            yield
+        finally:
+            self._users -= 1
+            if not self._users:
+                self._idle.set()
+
+    @asynccontextmanager
+    async def replace(self) -> AsyncIterator[None]:
+        """Wait for every current user to finish and keep new ones out until done."""
+        async with self._replacing:
+            self._open.clear()
+            try:
+                await self._idle.wait()
+                yield
+            finally:
+                self._open.set()
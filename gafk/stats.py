@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+import bisect
+import time
+from collections import Counter
+from typing import Any, Dict, List, Tuple
+
+# upper bounds in seconds of the latency histogram buckets, the last bucket is unbounded
+LATENCY_BUCKETS: Tuple[float, ...] = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+)
+
+
+class ListenerStats:
+    """Counters and a wall time histogram for the AFK message listener."""
+
+    def __init__(self):
+        self.counters: Counter = Counter()
+        self.buckets: List[int] = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.total_time: float = 0.0
+        self.max_time: float = 0.0
+        self.since: float = time.time()
+
+    def incr(self, name: str, amount: int = 1) -> None:
+        self.counters[name] += amount
+
+    def observe(self, seconds: float) -> None:
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.total_time += seconds
+        if seconds > self.max_time:
+            self.max_time = seconds
+
+    def percentile(self, fraction: float) -> float:
+        """Upper bound of the bucket holding the given fraction of observations."""
+        count = sum(self.buckets)
+        if not count:
+            return 0.0
+        seen = 0
+        for idx, bucket in enumerate(self.buckets):
+            seen += bucket
+            if seen >= count * fraction:
+                return LATENCY_BUCKETS[idx] if idx < len(LATENCY_BUCKETS) else self.max_time
+        return self.max_time
+
+    def snapshot(self) -> Dict[str, Any]:
+        count = sum(self.buckets)
+        return {
+            "since": self.since,
+            "counters": dict(self.counters),
+            "latency": {
+                "count": count,
+                "total": self.total_time,
+                "mean": self.total_time / count if count else 0.0,
+                "max": self.max_time,
+                "p50": self.percentile(0.5),
+                "p99": self.percentile(0.99),
+                "buckets": dict(zip((*LATENCY_BUCKETS, float("inf")), self.buckets)),
+            },
+        }
+
+    def reset(self) -> None:
+        self.__init__()
@@ -1,14 +1,25 @@
+import asyncio
+import tempfile
 from logging import getLogger
-from typing import List, Optional, Union
+from typing import Dict, List, Optional, Tuple, Union
 
+import aiohttp
 import discord
 from redbot.core import Config, commands
 from redbot.core.bot import Red
-from redbot.core.utils import chat_formatting as chat
-from redbot.core.utils.menus import DEFAULT_CONTROLS, menu
+from redbot.core.data_manager import cog_data_path
 from redbot.core.utils.predicates import MessagePredicate
 
+from .capability import CapabilitySnapshot
 from .converters import ActionReason, MemberID
+from .fanout import FanOutResult, fan_out
+from .functions import MemberLookup, UserNameCache
+from .index import BanIndex
+from .pages import LazyPages, chunk_lines, lazy_menu
+from .reconcile import GUILD_DELAY, reconcile_guild
+from .retry import RetryQueue
+from .store import BanStore
+from .transfer import CSV_HEADER, FORMATS, ban_all, format_ban, parse_ban
 
 logger = getLogger("red.dia.GlobalBan")
 
@@ -31,11 +42,175 @@ class GlobalBan(commands.Cog):
             return user.avatar_url
         return user.display_avatar.url
 
+    async def _fan_out_with_status(
+        self, ctx: commands.Context, verb: str, user, action, guilds: List[discord.Guild]
+    ) -> Tuple[discord.Message, FanOutResult]:
+        """Run ``action`` in every guild, editing a status message as guilds finish."""
+        status = await ctx.send(
+            embed=discord.Embed(description=f"{verb} {user} in 0/{len(guilds)} guilds...")
+        )
+
+        async def progress(done: int, total: int) -> None:
+            await status.edit(
+                embed=discord.Embed(description=f"{verb} {user} in {done}/{total} guilds...")
+            )
+
+        return status, await fan_out(guilds, action, progress=progress)
+
+    @staticmethod
+    def _outcome_note(retrying: List[discord.Guild], skipped: List[discord.Guild]) -> str:
+        note = ""
+        if retrying:
+            note += f"\nRetrying {len(retrying)} guilds in the background."
+        if skipped:
+            note += f"\nSkipped {len(skipped)} guilds where I'm not allowed to."
+        return note
+
+    async def _send_guild_report(
+        self,
+        ctx: commands.Context,
+        title: str,
+        guilds: List[discord.Guild],
+        *,
+        footer: Optional[str] = None,
+    ) -> None:
+        """Page through guilds, biggest first, rendering each page only when it is shown."""
+        lines = [
+            f"{idx}. `{guild.name}` with `{guild.member_count}` members.\n > Owned by [`{guild.owner}`] (`{guild.owner_id}`)\n"
+            for idx, guild in enumerate(
+                sorted(guilds, key=lambda g: g.member_count or 0, reverse=True), 1
+            )
+        ]
+        bounds = chunk_lines(lines)
+
+        async def render(page: int) -> discord.Embed:
+            start, end = bounds[page]
+            embed = discord.Embed(color=0x2F3136, description="".join(lines[start:end]))
+            embed.set_author(name=title, icon_url=self.get_avatar_url(self.bot.user))
+            text = f"Page {page + 1} of {len(bounds)}"
+            embed.set_footer(text=f"{text}\n{footer}" if footer else text)
+            return embed
+
+        await lazy_menu(ctx, LazyPages(len(bounds), render))
+
     def __init__(self, bot: Red):
         self.bot: Red = bot
         self.config = Config.get_conf(self, identifier=0x33039392, force_registration=True)
-        self.config.register_global(**{"banned": [], "reasons": {}})
+        # banned and reasons are only read once, to migrate them into the ban store
+        # reconcile_done holds the guilds already checked by the current reconciliation pass
+        # retry_jobs holds bans and unbans that failed and are retried in the background
+        self.config.register_global(
+            **{"banned": [], "reasons": {}, "reconcile_done": {}, "retry_jobs": {}}
+        )
         self.config.register_guild(**{"banned": []})
+        self.store: BanStore = BanStore(cog_data_path(self) / "bans.sqlite3")
+        self.bans: BanIndex = BanIndex()
+        self.user_names: UserNameCache = UserNameCache(bot)
+        self.member_lookup: MemberLookup = MemberLookup(bot)
+        self.capabilities: CapabilitySnapshot = CapabilitySnapshot()
+        self._reconcile_task: Optional[asyncio.Task] = None
+        self._reconcile_requested: asyncio.Event = asyncio.Event()
+        # a full pass runs on load and when requested, joined guilds are checked on their own
+        self._full_reconcile: bool = True
+        self._joined_guilds: Dict[int, None] = {}
+        self.retry_queue: RetryQueue = RetryQueue(
+            bot,
+            self.config.retry_jobs,
+            reason_for=lambda user_id: self.bans.global_bans.get(user_id),
+        )
+        self._retry_task: Optional[asyncio.Task] = None
+        self.session = aiohttp.ClientSession()
+
+    if discord.version_info.major >= 2:
+
+        async def cog_unload(self) -> None:
+            for task in (self._reconcile_task, self._retry_task):
+                if task is not None:
+                    task.cancel()
+            await self.store.close()
+            await self.session.close()
+
+    else:
+
+        def cog_unload(self) -> None:
+            for task in (self._reconcile_task, self._retry_task):
+                if task is not None:
+                    task.cancel()
+            self.bot.loop.create_task(self.store.close())
+            self.bot.loop.create_task(self.session.close())
+
+    async def initialize(self) -> None:
+        await self.store.open()
+        await self._migrate_config_bans()
+        self.bans.load(await self.store.load(), await self.config.all_guilds())
+        self._reconcile_task = self.bot.loop.create_task(self._reconcile_loop())
+        await self.retry_queue.load()
+        self._retry_task = self.bot.loop.create_task(self.retry_queue.run())
+
+    async def _migrate_config_bans(self) -> None:
+        """Move global bans stored in Config by older versions into the ban store."""
+        banned = await self.config.banned()
+        if not banned:
+            return
+        # reasons are keyed by user id, as strings once they went through JSON
+        reasons = {
+            int(user_id): reason for user_id, reason in (await self.config.reasons()).items()
+        }
+        await self.store.add_many((int(user_id), reasons.get(int(user_id))) for user_id in banned)
+        await self.config.banned.clear()
+        await self.config.reasons.clear()
+        logger.info("Migrated %s global bans from Config to the ban store.", len(banned))
+
+    async def _reconcile_loop(self) -> None:
+        """Run a reconciliation pass on load (resuming an unfinished one) and when requested.
+
+        Guilds joined in between are reconciled one after another by the same task.
+        """
+        await self.bot.wait_until_red_ready()
+        while True:
+            self._reconcile_requested.clear()
+            try:
+                if self._full_reconcile:
+                    self._full_reconcile = False
+                    await self._reconcile_pass()
+                await self._reconcile_joined()
+            except Exception:
+                logger.exception("Ban reconciliation pass failed.")
+            if self._full_reconcile or self._joined_guilds:
+                continue
+            await self._reconcile_requested.wait()
+
+    async def _reconcile_pass(self) -> None:
+        done = {int(guild_id) for guild_id in await self.config.reconcile_done()}
+        for guild in list(self.bot.guilds):
+            if guild.id in done:
+                continue
+            await self._reconcile(guild)
+            # checkpoint, a restart resumes after the last finished guild
+            await self.config.reconcile_done.set_raw(str(guild.id), value=True)
+            await asyncio.sleep(GUILD_DELAY)
+        await self.config.reconcile_done.clear()
+
+    async def _reconcile_joined(self) -> None:
+        while self._joined_guilds:
+            guild_id = next(iter(self._joined_guilds))
+            del self._joined_guilds[guild_id]
+            guild = self.bot.get_guild(guild_id)
+            if guild is None:
+                continue
+            await self._reconcile(guild)
+            await asyncio.sleep(GUILD_DELAY)
+
+    async def _reconcile(self, guild: discord.Guild) -> None:
+        try:
+            await reconcile_guild(
+                guild,
+                self.bans.banned_in(guild.id),
+                lambda user_id: self.bans.reason_for(guild.id, user_id),
+                lambda user_id: self.capabilities.can_ban(guild, user_id),
+            )
+        except (discord.HTTPException, discord.Forbidden) as e:
+            logger.warning(f"Couldn't reconcile bans in {guild.name}/{guild.id}: {e}")
 
     @commands.command()
     @commands.is_owner()
@@ -50,24 +225,20 @@ class GlobalBan(commands.Cog):
         """Ban a user globally from all servers [botname] is in."""
         if not reason:
             reason = f"Global ban by {ctx.author} (ID: {ctx.author.id})"
-        async with self.config.banned() as f:
-            if user.id not in f:
-                f.append(user.id)
-        old_conf = await self.config.reasons()
-        old_conf[user.id] = reason
-        await self.config.reasons.set(old_conf)
-        banned_guilds: List[discord.Guild] = []
-        couldnt_ban: List[discord.Guild] = []
-        for guild in self.bot.guilds:
-            try:
-                await guild.ban(user, reason=reason)
-            except (discord.HTTPException, discord.Forbidden):
-                couldnt_ban.append(guild)
-            finally:
-                banned_guilds.append(guild)
-        ctx_sent = await ctx.send(
+        await self.store.add(user.id, reason)
+        self.bans.add_global(user.id, reason)
+        guilds, skipped = self.capabilities.split(self.bot.guilds, user.id)
+        ctx_sent, result = await self._fan_out_with_status(
+            ctx, "Banning", user, lambda guild: guild.ban(user, reason=reason), guilds
+        )
+        banned_guilds: List[discord.Guild] = result.succeeded
+        couldnt_ban: List[discord.Guild] = result.failed
+        # only rate limits, 5xx and transport errors can go away by themselves
+        retrying = result.transient_failures()
+        await self.retry_queue.schedule(user.id, "ban", reason, retrying)
+        await ctx_sent.edit(
             embed=discord.Embed(
-                description=f"Banned {user} from {len(banned_guilds)}/{len(self.bot.guilds)} guilds.\nRespond with `yes` to see which guilds they were banned in and couldn't be banned in (if applicable)."
+                description=f"Banned {user} from {len(banned_guilds)}/{len(self.bot.guilds)} guilds.{self._outcome_note(retrying, skipped)}\nRespond with `yes` to see which guilds they were banned in and couldn't be banned in (if applicable)."
             )
         )
         pred = MessagePredicate.yes_or_no(ctx)
@@ -75,52 +246,21 @@ class GlobalBan(commands.Cog):
         if pred.result is False:
             await ctx_sent.edit(
                 embed=discord.Embed(
-                    description=f"Banned {user} from {len(banned_guilds)}/{len(self.bot.guilds)} guilds."
+                    description=f"Banned {user} from {len(banned_guilds)}/{len(self.bot.guilds)} guilds.{self._outcome_note(retrying, skipped)}"
                 )
             )
             return
         if banned_guilds:
-            banned_message: str = ""
-            banned_pages: List[str] = []
-            banned_embeds: List[discord.Embed] = []
-            for idx, guild in enumerate(
-                sorted(banned_guilds, key=lambda g: g.member_count, reverse=True), 1
-            ):
-                banned_message += f"{idx}. `{guild.name}` with `{guild.member_count}` members.\n > Owned by [`{guild.owner}`] (`{guild.owner.id}`)\n/20jaajs0b/"
-                for page in chat.pagify(banned_message, delims=["/20jaajs0b/"], page_length=1500):
-                    banned_pages.append(page)
-            for idx, page in enumerate(banned_pages, 1):
-                embed = discord.Embed(color=0x2F3136)
-                embed.set_author(
-                    name=f"Banned {user} from:",
-                    icon_url=self.get_avatar_url(self.bot.user),
-                )
-                embed.description = page.replace("/20jaajs0b/", "")
-                embed.set_footer(
-                    text=f"Page {idx} of {len(banned_guilds)}\nTotal: {len(self.bot.guilds)} servers"
-                )
-                banned_embeds.append(embed)
-            await menu(ctx, banned_embeds, DEFAULT_CONTROLS)
+            await self._send_guild_report(
+                ctx,
+                f"Banned {user} from:",
+                banned_guilds,
+                footer=f"Total: {len(self.bot.guilds)} servers",
+            )
         if couldnt_ban:
-            couldnt_message: str = ""
-            couldnt_pages: List[str] = []
-            couldnt_embeds: List[discord.Embed] = []
-            for idx, guild in enumerate(
-                sorted(couldnt_ban, key=lambda g: g.member_count, reverse=True), 1
-            ):
-                couldnt_message += f"{idx}. `{guild.name}` with `{guild.member_count}` members.\n > Owned by [`{guild.owner}`] (`{guild.owner.id}`)\n/20jaajs0b/"
-                for page in chat.pagify(couldnt_message, delims=["/20jaajs0b/"]):
-                    couldnt_pages.append(page)
-            for idx, page in enumerate(couldnt_pages, 1):
-                embed = discord.Embed(color=0x2F3136)
-                embed.set_author(
-                    name=f"Couldn't ban {user} from:",
-                    icon_url=self.get_avatar_url(self.bot.user),
-                )
-                embed.description = page.replace("/20jaajs0b/", "")
-                embed.set_footer(text=f"Page {idx} of {len(couldnt_ban)}")
-                couldnt_embeds.append(embed)
-            await menu(ctx, couldnt_embeds, DEFAULT_CONTROLS)
+            await self._send_guild_report(ctx, f"Couldn't ban {user} from:", couldnt_ban)
+        if skipped:
+            await self._send_guild_report(ctx, f"Not allowed to ban {user} in:", skipped)
 
     @commands.command()
     @commands.is_owner()
@@ -135,21 +275,19 @@ class GlobalBan(commands.Cog):
         """Unban a user globally from all servers [botname] is in."""
         if not reason:
             reason = f"Global unban by {ctx.author} (ID: {ctx.author.id})"
-        async with self.config.banned() as f:
-            if user.id in f:
-                f.remove(user.id)
-        unbanned_guilds: List[discord.Guild] = []
-        couldnt_unban: List[discord.Guild] = []
-        for guild in self.bot.guilds:
-            try:
-                await guild.unban(user, reason=reason)
-            except (discord.HTTPException, discord.Forbidden):
-                couldnt_unban.append(guild)
-            finally:
-                unbanned_guilds.append(guild)
-        ctx_sent = await ctx.send(
+        await self.store.remove(user.id)
+        self.bans.remove_global(user.id)
+        guilds, skipped = self.capabilities.split(self.bot.guilds)
+        ctx_sent, result = await self._fan_out_with_status(
+            ctx, "Unbanning", user, lambda guild: guild.unban(user, reason=reason), guilds
+        )
+        unbanned_guilds: List[discord.Guild] = result.succeeded
+        couldnt_unban: List[discord.Guild] = result.failed
+        retrying = result.transient_failures()
+        await self.retry_queue.schedule(user.id, "unban", reason, retrying)
+        await ctx_sent.edit(
             embed=discord.Embed(
-                description=f"Unbanned {user} from {len(unbanned_guilds)}/{len(self.bot.guilds)} guilds.\nRespond with `yes` to see which guilds they were unbanned in and couldn't be unbanned in (if applicable)."
+                description=f"Unbanned {user} from {len(unbanned_guilds)}/{len(self.bot.guilds)} guilds.{self._outcome_note(retrying, skipped)}\nRespond with `yes` to see which guilds they were unbanned in and couldn't be unbanned in (if applicable)."
             )
         )
         pred = MessagePredicate.yes_or_no(ctx)
@@ -157,52 +295,117 @@ class GlobalBan(commands.Cog):
         if pred.result is False:
             await ctx_sent.edit(
                 embed=discord.Embed(
-                    description=f"Unbanned {user} from {len(unbanned_guilds)}/{len(self.bot.guilds)} guilds."
+                    description=f"Unbanned {user} from {len(unbanned_guilds)}/{len(self.bot.guilds)} guilds.{self._outcome_note(retrying, skipped)}"
                 )
             )
             return
         if unbanned_guilds:
-            unbanned_message: str = ""
-            unbanned_pages: List[str] = []
-            unbanned_embeds: List[discord.Embed] = []
-            for idx, guild in enumerate(
-                sorted(unbanned_guilds, key=lambda g: g.member_count, reverse=True), 1
-            ):
-                unbanned_message += f"{idx}. `{guild.name}` with `{guild.member_count}` members.\n > Owned by [`{guild.owner}`] (`{guild.owner.id}`)\n/20jaajs0b/"
-                for page in chat.pagify(
-                    unbanned_message, delims=["/20jaajs0b/"], page_length=1500
-                ):
-                    unbanned_pages.append(page)
-            for idx, page in enumerate(unbanned_pages, 1):
-                embed = discord.Embed(color=0x2F3136)
-                embed.set_author(
-                    name=f"Unbanned {user} from:",
-                    icon_url=self.get_avatar_url(self.bot.user),
-                )
-                embed.description = page.replace("/20jaajs0b/", "")
-                embed.set_footer(text=f"Page {idx} of {len(unbanned_guilds)}")
-                unbanned_embeds.append(embed)
-            await menu(ctx, unbanned_embeds, DEFAULT_CONTROLS)
+            await self._send_guild_report(ctx, f"Unbanned {user} from:", unbanned_guilds)
         if couldnt_unban:
-            couldnt_message: str = ""
-            couldnt_pages: List[str] = []
-            couldnt_embeds: List[discord.Embed] = []
-            for idx, guild in enumerate(
-                sorted(couldnt_unban, key=lambda g: g.member_count, reverse=True), 1
-            ):
-                couldnt_message += f"{idx}. `{guild.name}` with `{guild.member_count}` members.\n > Owned by [`{guild.owner}`] (`{guild.owner.id}`)\n/20jaajs0b/"
-                for page in chat.pagify(couldnt_message, delims=["/20jaajs0b/"]):
-                    couldnt_pages.append(page)
-            for idx, page in enumerate(couldnt_pages, 1):
-                embed = discord.Embed(color=0x2F3136)
-                embed.set_author(
-                    name=f"Couldn't unban {user} from:",
-                    icon_url=self.get_avatar_url(self.bot.user),
+            await self._send_guild_report(ctx, f"Couldn't unban {user} from:", couldnt_unban)
+        if skipped:
+            await self._send_guild_report(ctx, f"Not allowed to unban {user} in:", skipped)
+
+    @commands.command()
+    @commands.is_owner()
+    async def globalbanexport(self, ctx: commands.Context, fmt: str = "jsonl") -> None:
+        """Export every global ban as a JSON lines or CSV file.
+
+        `fmt` is either `jsonl` or `csv`.
+        """
+        fmt = fmt.lower()
+        if fmt not in FORMATS:
+            return await ctx.send(f"Format must be one of: {', '.join(FORMATS)}.")
+        if not self.bans.global_bans:
+            return await ctx.send("No user has been globally banned.")
+        # written to disk line by line instead of building one string
+        with tempfile.TemporaryFile() as fp:
+            if fmt == "csv":
+                fp.write(CSV_HEADER.encode("utf-8"))
+            for user_id, reason in list(self.bans.global_bans.items()):
+                fp.write(format_ban(user_id, reason, fmt).encode("utf-8"))
+            fp.seek(0)
+            try:
+                await ctx.send(
+                    f"Exported {len(self.bans.global_bans)} global bans.",
+                    file=discord.File(fp, filename=f"globalbans.{fmt}"),
                 )
-                embed.description = page.replace("/20jaajs0b/", "")
-                embed.set_footer(text=f"Page {idx} of {len(couldnt_unban)}")
-                couldnt_embeds.append(embed)
-            await menu(ctx, couldnt_embeds, DEFAULT_CONTROLS)
+            except discord.HTTPException as e:
+                # most likely over the upload limit of this channel
+                await ctx.send(f"Couldn't upload the export: {e}")
+
+    @commands.command()
+    @commands.is_owner()
+    @commands.guild_only()
+    async def globalbanimport(self, ctx: commands.Context) -> None:
+        """Import global bans from an attached JSON lines or CSV file.
+
+        JSON lines files hold one `{"user_id": ..., "reason": ...}` object (or a bare ID) per line,
+        CSV files have a `user_id,reason` header. Files ending in `.csv` are read as CSV.
+        Users that are already globally banned are skipped.
+        """
+        if not ctx.message.attachments:
+            return await ctx.send("Attach a `.jsonl` or `.csv` file to import.")
+        attachment = ctx.message.attachments[0]
+        fmt = "csv" if attachment.filename.lower().endswith(".csv") else "jsonl"
+        default_reason = f"Global ban by {ctx.author} (ID: {ctx.author.id})"
+        imported: Dict[int, str] = {}
+        invalid = 0
+        async with self.session.get(attachment.url) as r:
+            if r.status != 200:
+                return await ctx.send("Couldn't download the attachment.")
+            lines = 0
+            # read line by line, the file is never held in memory as a whole
+            try:
+                async for raw in r.content:
+                    lines += 1
+                    try:
+                        parsed = parse_ban(raw.decode("utf-8"), fmt)
+                    except (ValueError, KeyError, TypeError, IndexError):
+                        invalid += 1
+                        continue
+                    if parsed is None:
+                        continue
+                    user_id, reason = parsed
+                    if not self.bans.is_global_banned(user_id):
+                        imported[user_id] = reason or default_reason
+            except ValueError:
+                # aiohttp refuses lines longer than its read buffer
+                return await ctx.send(
+                    f"Line {lines + 1} of the attachment is too long. Nothing was imported."
+                )
+        if not imported:
+            return await ctx.send(f"Nothing to import. Skipped {invalid} invalid lines.")
+        # a single transaction, however many users are imported
+        await self.store.add_many(imported.items())
+        for user_id, reason in imported.items():
+            self.bans.add_global(user_id, reason)
+        user_ids = list(imported)
+        done: Dict[int, int] = {}
+        guilds, skipped = self.capabilities.split(self.bot.guilds)
+        ctx_sent, result = await self._fan_out_with_status(
+            ctx,
+            "Banning",
+            f"{len(user_ids)} users",
+            lambda guild: ban_all(
+                guild, user_ids, reason=default_reason, done=done, reason_for=imported.get
+            ),
+            guilds,
+        )
+        retrying = result.transient_failures()
+        # one bulk job per guild, holding only the users it didn't get to yet
+        await self.retry_queue.schedule_bulk(
+            default_reason, {guild: user_ids[done.get(guild.id, 0) :] for guild in retrying}
+        )
+        await ctx_sent.edit(
+            embed=discord.Embed(
+                description=f"Imported {len(user_ids)} global bans ({invalid} invalid lines skipped) and applied them in {len(result.succeeded)}/{len(self.bot.guilds)} guilds.{self._outcome_note(retrying, skipped)}"
+            )
+        )
+        if result.failed:
+            await self._send_guild_report(
+                ctx, "Couldn't apply every imported ban in:", result.failed
+            )
 
     @commands.command()
     @commands.has_permissions(administrator=True)
@@ -220,6 +423,7 @@ class GlobalBan(commands.Cog):
         async with self.config.guild(ctx.guild).banned() as f:
             if user.id not in f:
                 f.append(user.id)
+        self.bans.add_hard(ctx.guild.id, user.id)
         try:
             await ctx.guild.ban(user, reason=reason)
         except (discord.HTTPException, discord.Forbidden):
@@ -242,56 +446,53 @@ class GlobalBan(commands.Cog):
         async with self.config.guild(ctx.guild).banned() as f:
             if user.id in f:
                 f.remove(user.id)
+        self.bans.remove_hard(ctx.guild.id, user.id)
         try:
             await ctx.guild.unban(user, reason=reason)
         except (discord.HTTPException, discord.Forbidden):
             return await ctx.send(embed=discord.Embed(description="Couldn't unban {user}."))
         await ctx.send(embed=discord.Embed(description=f"Unbanned {user}."))
 
+    async def _send_user_list(self, ctx: commands.Context, user_ids: List[int]) -> None:
+        """Page through user IDs, looking up names only for the page being shown."""
+        per_page = 15
+        page_count = -(-len(user_ids) // per_page)
+
+        async def render(page: int) -> str:
+            chunk = user_ids[page * per_page : (page + 1) * per_page]
+            names = await self.user_names.resolve_many(chunk)
+            lines = "\n".join(
+                f"{names[user_id] or 'Unknown user'} - ({user_id})" for user_id in chunk
+            )
+            return f"{lines}\n\nPage {page + 1} of {page_count}"
+
+        await lazy_menu(ctx, LazyPages(page_count, render))
+
     @commands.command()
     @commands.is_owner()
     @commands.guild_only()
     async def listglobalban(self, ctx: commands.Context) -> None:
         """List all global banned users."""
-        message: str = ""
-        pages: List[str] = []
-        async with self.config.banned() as ff:
-            if len(ff) == 0:
-                return await ctx.send("No user has been globally banned.")
-            for x in ff:
-                x = await self.bot.get_or_fetch_user(x)
-                message += f"{str(x)} - ({x.id})"
-        for page in chat.pagify(message):
-            pages.append(page)
-        await menu(ctx, pages, DEFAULT_CONTROLS)
+        if not self.bans.global_bans:
+            return await ctx.send("No user has been globally banned.")
+        await self._send_user_list(ctx, list(self.bans.global_bans))
 
     @commands.command()
     @commands.has_permissions(administrator=True)
     @commands.guild_only()
     async def listhardban(self, ctx: commands.Context) -> None:
         """List all hard banned users."""
-        message: str = ""
-        pages: List[str] = []
-        async with self.config.guild(ctx.guild).banned() as ff:
-            if len(ff) == 0:
-                return await ctx.send("No user has been hard banned.")
-            for x in ff:
-                x = await self.bot.get_or_fetch_user(x)
-                message += f"{str(x)} - ({x.id})"
-        for page in chat.pagify(message):
-            pages.append(page)
-        await menu(ctx, pages, DEFAULT_CONTROLS)
+        if not self.bans.hard_bans.get(ctx.guild.id):
+            return await ctx.send("No user has been hard banned.")
+        await self._send_user_list(ctx, sorted(self.bans.hard_bans[ctx.guild.id]))
 
     @commands.Cog.listener()
     async def on_member_unban(self, guild: discord.Guild, user: discord.User):
         """
         Ban global banned users auto-fucking-matically
         """
-        global_banned = await self.config.banned()
-        guild_banned = await self.config.guild(guild).banned()
-        global_reason = (await self.config.reasons()).get(user.id)
-
-        if user.id in global_banned:
+        if self.bans.is_global_banned(user.id):
+            global_reason = self.bans.global_bans[user.id]
             try:
                 await guild.ban(
                     user,
@@ -300,19 +501,59 @@ class GlobalBan(commands.Cog):
             except (discord.HTTPException, discord.Forbidden) as e:
                 logger.exception(e)
 
-        if user.id in guild_banned:
+        if self.bans.is_hard_banned(guild.id, user.id):
             try:
                 await guild.ban(user, reason="Hard banned by bot owner.")
             except (discord.HTTPException, discord.Forbidden) as e:
                 logger.exception(e)
 
+    @commands.Cog.listener()
+    async def on_member_join(self, member: discord.Member) -> None:
+        """Ban global and hard banned users that got back in, for example during downtime."""
+        guild = member.guild
+        if not self.bans.is_banned(guild.id, member.id):
+            return
+        if not self.capabilities.can_ban(guild, member.id):
+            return
+        try:
+            await member.ban(reason=self.bans.reason_for(guild.id, member.id))
+        except (discord.HTTPException, discord.Forbidden) as e:
+            logger.warning(f"Couldn't ban {member.id} on join in {guild.name}/{guild.id}: {e}")
+
+    @commands.command()
+    @commands.is_owner()
+    async def reconcilebans(self, ctx: commands.Context) -> None:
+        """Make sure every global and hard ban is applied in every server [botname] is in.
+
+        This also runs automatically whenever the cog loads.
+        """
+        self._full_reconcile = True
+        self._reconcile_requested.set()
+        await ctx.send(
+            "Ban reconciliation will run in the background once the current pass, if any, finishes."
+        )
+
+    @commands.Cog.listener()
+    async def on_guild_join(self, guild: discord.Guild) -> None:
+        # left to the reconciliation task, which throttles guilds against each other
+        self._joined_guilds[guild.id] = None
+        self._reconcile_requested.set()
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild: discord.Guild) -> None:
+        self.capabilities.drop(guild.id)
+        self._joined_guilds.pop(guild.id, None)
+        await self.retry_queue.drop_guild(guild.id)
+
     @commands.Cog.listener()
     async def on_guild_role_update(self, before: discord.Role, after: discord.Role) -> None:
+        # any role change can move the bot's top role or change its permissions
+        capability = self.capabilities.refresh(after.guild)
         if not after.is_bot_managed():
             return
         if after.members and after.members[0].id != self.bot.user.id:
             return
-        if not after.guild.me.guild_permissions.ban_members:
+        if not capability.can_ban:
             logger.info(
                 f"Leaving {after.guild.name}/{after.guild.id} as they removed ban members permission from me."
             )
@@ -325,7 +566,7 @@ class GlobalBan(commands.Cog):
     async def on_member_update(self, before: discord.Member, after: discord.Member) -> None:
         if after.id != self.bot.user.id:
             return
-        if not after.guild_permissions.ban_members:
+        if not self.capabilities.refresh(after.guild).can_ban:
             logger.info(
                 f"Leaving {after.guild.name}/{after.guild.id} as they removed ban members permission from me."
             )
@@ -338,3 +579,4 @@ class GlobalBan(commands.Cog):
 async def setup(bot: Red):
     cog = GlobalBan(bot)
     await discord.utils.maybe_coroutine(bot.add_cog, cog)
+    await cog.initialize()
@@ -0,0 +1,60 @@
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import discord
+
+
+class GuildCapability(NamedTuple):
+    can_ban: bool
+    # position of the bot's top role, it can only ban members whose top role is lower
+    top_role_position: int
+
+
+class CapabilitySnapshot:
+    """What the bot is allowed to do in each guild, so hopeless requests are never sent.
+
+    Entries are filled the first time a guild is looked at and refreshed by the role
+    and member update listeners.
+    """
+
+    def __init__(self):
+        self.guilds: Dict[int, GuildCapability] = {}
+
+    def refresh(self, guild: discord.Guild) -> GuildCapability:
+        me = guild.me
+        if me is None:
+            capability = GuildCapability(False, 0)
+        else:
+            capability = GuildCapability(me.guild_permissions.ban_members, me.top_role.position)
+        self.guilds[guild.id] = capability
+        return capability
+
+    def drop(self, guild_id: int) -> None:
+        self.guilds.pop(guild_id, None)
+
+    def get(self, guild: discord.Guild) -> GuildCapability:
+        capability = self.guilds.get(guild.id)
+        if capability is None:
+            capability = self.refresh(guild)
+        return capability
+
+    def can_ban(self, guild: discord.Guild, user_id: Optional[int] = None) -> bool:
+        """Whether the bot can ban in the guild, and ban ``user_id`` when given."""
+        capability = self.get(guild)
+        if not capability.can_ban:
+            return False
+        if user_id is None:
+            return True
+        if user_id == guild.owner_id:
+            return False
+        member = guild.get_member(user_id)
+        return member is None or member.top_role.position < capability.top_role_position
+
+    def split(
+        self, guilds: Iterable[discord.Guild], user_id: Optional[int] = None
+    ) -> Tuple[List[discord.Guild], List[discord.Guild]]:
+        """Split guilds into the ones where the bot can ban and the ones where it can't."""
+        possible: List[discord.Guild] = []
+        impossible: List[discord.Guild] = []
+        for guild in guilds:
+            (possible if self.can_ban(guild, user_id) else impossible).append(guild)
+        return possible, impossible
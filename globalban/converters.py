@@ -26,7 +26,11 @@ class MemberID(commands.Converter):
                 ) from None
             else:
                 member_id = int(argument, base=10)
-                m = await get_or_fetch_member(ctx, guild=ctx.guild, member_id=member_id)
+                lookup = getattr(ctx.cog, "member_lookup", None)
+                if lookup is not None:
+                    m = await lookup.get(ctx.guild, member_id)
+                else:
+                    m = await get_or_fetch_member(ctx, guild=ctx.guild, member_id=member_id)
                 if m is None:
                     # hackban case
                     return type(
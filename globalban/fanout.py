@@ -0,0 +1,126 @@
+import asyncio
+import random
+from collections import defaultdict
+from logging import getLogger
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, NamedTuple, Optional
+
+import aiohttp
+import discord
+
+logger = getLogger("red.dia.GlobalBan")
+
+# requests in flight across all shards, and per shard
+DEFAULT_CONCURRENCY: int = 20
+DEFAULT_PER_SHARD: int = 5
+MAX_RETRIES: int = 3
+
+# errors raised below the HTTP layer, the request may not even have reached Discord
+TRANSPORT_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError, OSError)
+
+
+class FanOutResult(NamedTuple):
+    succeeded: List[discord.Guild]
+    failed: List[discord.Guild]
+    # guild id -> the exception that made it fail
+    errors: Dict[int, Exception]
+
+    def transient_failures(self) -> List[discord.Guild]:
+        """Failed guilds worth trying again later."""
+        return [guild for guild in self.failed if is_transient(self.errors[guild.id])]
+
+
+def is_transient(error: Exception) -> bool:
+    """Whether a failed request may succeed if repeated: rate limits, 5xx and transport errors."""
+    if isinstance(error, discord.HTTPException):
+        return error.status == 429 or error.status >= 500
+    return isinstance(error, TRANSPORT_ERRORS)
+
+
+def _retry_delay(error: Exception, attempt: int) -> float:
+    retry_after = None
+    response = getattr(error, "response", None)
+    if response is not None and getattr(response, "headers", None) is not None:
+        retry_after = response.headers.get("Retry-After")
+    if retry_after is not None:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    return 2**attempt + random.random()
+
+
+async def fan_out(
+    guilds: Iterable[discord.Guild],
+    action: Callable[[discord.Guild], Awaitable[Any]],
+    *,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    per_shard: int = DEFAULT_PER_SHARD,
+    max_retries: int = MAX_RETRIES,
+    progress: Optional[Callable[[int, int], Awaitable[Any]]] = None,
+    progress_interval: float = 2.0,
+) -> FanOutResult:
+    """Run ``action`` for every guild concurrently.
+
+    Guilds are grouped by shard and each shard is worked through by a few workers,
+    with at most ``concurrency`` requests in flight overall. Rate limited and 5xx
+    responses are retried with backoff, honouring ``Retry-After`` when present.
+    ``progress(done, total)`` is awaited every ``progress_interval`` seconds and once
+    at the end.
+    """
+    by_shard: Dict[Optional[int], List[discord.Guild]] = defaultdict(list)
+    for guild in guilds:
+        by_shard[guild.shard_id].append(guild)
+    total = sum(len(shard_guilds) for shard_guilds in by_shard.values())
+    semaphore = asyncio.Semaphore(concurrency)
+    succeeded: List[discord.Guild] = []
+    failed: List[discord.Guild] = []
+    errors: Dict[int, Exception] = {}
+
+    async def run(guild: discord.Guild) -> None:
+        for attempt in range(max_retries + 1):
+            try:
+                async with semaphore:
+                    await action(guild)
+            except (discord.HTTPException, *TRANSPORT_ERRORS) as e:
+                if attempt < max_retries and is_transient(e):
+                    await asyncio.sleep(_retry_delay(e, attempt))
+                    continue
+                failed.append(guild)
+                errors[guild.id] = e
+            else:
+                succeeded.append(guild)
+            return
+
+    async def worker(queue: List[discord.Guild]) -> None:
+        while queue:
+            await run(queue.pop())
+
+    async def report() -> None:
+        while True:
+            await asyncio.sleep(progress_interval)
+            await _report_progress(progress, len(succeeded) + len(failed), total)
+
+    reporter = asyncio.create_task(report()) if progress is not None else None
+    try:
+        await asyncio.gather(
+            *(
+                worker(shard_guilds)
+                for shard_guilds in by_shard.values()
+                for _ in range(min(per_shard, len(shard_guilds)))
+            )
+        )
+    finally:
+        if reporter is not None:
+            reporter.cancel()
+    if progress is not None:
+        await _report_progress(progress, total, total)
+    return FanOutResult(succeeded, failed, errors)
+
+
+async def _report_progress(
+    progress: Callable[[int, int], Awaitable[Any]], done: int, total: int
+) -> None:
+    try:
+        await progress(done, total)
+    except discord.HTTPException as e:
+        logger.debug("Couldn't report fan-out progress: %s", e)
@@ -1,5 +1,12 @@
+import asyncio
+import time
+from logging import getLogger
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
 import discord
 
+logger = getLogger("red.dia.GlobalBan")
+
 
 async def get_or_fetch_member(self, guild, member_id):
     """Looks up a member in cache or fetches if not found.
@@ -32,3 +39,144 @@ async def get_or_fetch_member(self, guild, member_id):
     if not members:
         return None
     return members[0]
+
+
+class UserNameCache:
+    """Resolves user IDs to names, remembering answers for a while.
+
+    Unknown or deleted users are remembered too, for a shorter time, so pages
+    full of deleted accounts don't hit the API again on every view.
+    """
+
+    def __init__(self, bot, *, ttl: float = 3600, negative_ttl: float = 600, concurrency: int = 5):
+        self.bot = bot
+        self.ttl: float = ttl
+        self.negative_ttl: float = negative_ttl
+        self._semaphore = asyncio.Semaphore(concurrency)
+        # user id -> (name or None when the user doesn't exist, expiry)
+        self._cache: Dict[int, Tuple[Optional[str], float]] = {}
+
+    def _remember(self, user_id: int, name: Optional[str], now: float) -> None:
+        if len(self._cache) >= 10000:
+            self._cache = {k: v for k, v in self._cache.items() if v[1] > now}
+        self._cache[user_id] = (name, now + (self.ttl if name is not None else self.negative_ttl))
+
+    async def _fetch(self, user_id: int) -> Optional[str]:
+        async with self._semaphore:
+            try:
+                user = await self.bot.fetch_user(user_id)
+            except discord.NotFound:
+                self._remember(user_id, None, time.monotonic())
+                return None
+            except discord.HTTPException:
+                # not cached, it may work next time
+                return None
+        self._remember(user_id, str(user), time.monotonic())
+        return str(user)
+
+    async def resolve_many(self, user_ids: Iterable[int]) -> Dict[int, Optional[str]]:
+        """Return each user's name, or None for users that couldn't be found."""
+        now = time.monotonic()
+        names: Dict[int, Optional[str]] = {}
+        missing = []
+        for user_id in user_ids:
+            cached = self._cache.get(user_id)
+            if cached is not None and cached[1] > now:
+                names[user_id] = cached[0]
+                continue
+            user = self.bot.get_user(user_id)
+            if user is not None:
+                names[user_id] = str(user)
+                self._remember(user_id, names[user_id], now)
+            else:
+                missing.append(user_id)
+        fetched = await asyncio.gather(*(self._fetch(user_id) for user_id in missing))
+        names.update(zip(missing, fetched))
+        return names
+
+
+class MemberLookup:
+    """Looks up members by ID, merging concurrent lookups in a guild into one request.
+
+    Lookups arriving within ``window`` seconds of each other in the same guild are
+    sent as a single ``query_members`` call, a lookup for an ID already in flight
+    waits on that request instead of making its own, and misses are remembered for
+    ``negative_ttl`` seconds.
+    """
+
+    # query_members accepts at most this many user IDs
+    BATCH_SIZE: int = 100
+
+    def __init__(self, bot, *, window: float = 0.05, negative_ttl: float = 60):
+        self.bot = bot
+        self.window: float = window
+        self.negative_ttl: float = negative_ttl
+        # (guild id, member id) -> future of a lookup in flight
+        self._in_flight: Dict[Tuple[int, int], asyncio.Future] = {}
+        # guild id -> ids waiting for the next batch
+        self._pending: Dict[int, List[int]] = {}
+        # (guild id, member id) -> when the miss stops being remembered
+        self._misses: Dict[Tuple[int, int], float] = {}
+        # pending batch flushes, the event loop only keeps weak references to tasks
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def get(self, guild: discord.Guild, member_id: int) -> Optional[discord.Member]:
+        """The member or None if not found."""
+        member = guild.get_member(member_id)
+        if member is not None:
+            return member
+        key = (guild.id, member_id)
+        now = time.monotonic()
+        if self._misses.get(key, 0) > now:
+            return None
+        future = self._in_flight.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._in_flight[key] = future
+            if guild.id not in self._pending:
+                self._pending[guild.id] = []
+                task = asyncio.create_task(self._flush_later(guild))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+            self._pending[guild.id].append(member_id)
+        return await asyncio.shield(future)
+
+    async def _flush_later(self, guild: discord.Guild) -> None:
+        await asyncio.sleep(self.window)
+        member_ids = self._pending.pop(guild.id, [])
+        for idx in range(0, len(member_ids), self.BATCH_SIZE):
+            await self._lookup(guild, member_ids[idx : idx + self.BATCH_SIZE])
+
+    async def _lookup(self, guild: discord.Guild, member_ids: List[int]) -> None:
+        found: Dict[int, discord.Member] = {}
+        # stays set unless the request completes, a cancelled lookup mustn't cache misses either
+        failed = True
+        try:
+            shard = self.bot.get_shard(guild.shard_id)
+            if shard is not None and shard.is_ws_ratelimited():
+                for member_id in member_ids:
+                    try:
+                        found[member_id] = await guild.fetch_member(member_id)
+                    except discord.NotFound:
+                        continue
+            else:
+                members = await guild.query_members(
+                    limit=len(member_ids), user_ids=member_ids, cache=True
+                )
+                found = {member.id: member for member in members}
+            failed = False
+        except Exception:
+            # don't remember misses of a lookup that failed, it may work next time
+            logger.exception(f"Member lookup in {guild.name}/{guild.id} failed")
+        finally:
+            now = time.monotonic()
+            if len(self._misses) >= 10000:
+                self._misses = {k: v for k, v in self._misses.items() if v > now}
+            for member_id in member_ids:
+                key = (guild.id, member_id)
+                member = found.get(member_id)
+                if member is None and not failed:
+                    self._misses[key] = now + self.negative_ttl
+                future = self._in_flight.pop(key, None)
+                if future is not None and not future.done():
+                    future.set_result(member)
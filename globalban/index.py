@@ -0,0 +1,63 @@
+from typing import Any, Dict, Mapping, Optional, Set
+
+
+class BanIndex:
+    """In-memory view of the global and hard ban lists.
+
+    Loaded once from the ban store and Config and updated by every ban command, so enforcement
+    never has to touch Config.
+    """
+
+    def __init__(self):
+        # user id -> reason of the global ban, None when no reason was stored
+        self.global_bans: Dict[int, Optional[str]] = {}
+        # guild id -> ids of users hard banned there
+        self.hard_bans: Dict[int, Set[int]] = {}
+
+    def load(
+        self,
+        global_bans: Mapping[int, Optional[str]],
+        guilds: Mapping[int, Mapping[str, Any]],
+    ) -> None:
+        self.global_bans = dict(global_bans)
+        self.hard_bans = {
+            int(guild_id): {int(user_id) for user_id in data["banned"]}
+            for guild_id, data in guilds.items()
+            if data["banned"]
+        }
+
+    def add_global(self, user_id: int, reason: Optional[str]) -> None:
+        self.global_bans[user_id] = reason
+
+    def remove_global(self, user_id: int) -> None:
+        self.global_bans.pop(user_id, None)
+
+    def add_hard(self, guild_id: int, user_id: int) -> None:
+        self.hard_bans.setdefault(guild_id, set()).add(user_id)
+
+    def remove_hard(self, guild_id: int, user_id: int) -> None:
+        banned = self.hard_bans.get(guild_id)
+        if banned is None:
+            return
+        banned.discard(user_id)
+        if not banned:
+            del self.hard_bans[guild_id]
+
+    def is_global_banned(self, user_id: int) -> bool:
+        return user_id in self.global_bans
+
+    def is_hard_banned(self, guild_id: int, user_id: int) -> bool:
+        return user_id in self.hard_bans.get(guild_id, ())
+
+    def is_banned(self, guild_id: int, user_id: int) -> bool:
+        """Whether a user should be banned in a guild, without building the union."""
+        return user_id in self.global_bans or self.is_hard_banned(guild_id, user_id)
+
+    def banned_in(self, guild_id: int) -> Set[int]:
+        """Every user that should be banned in a guild."""
+        return self.global_bans.keys() | self.hard_bans.get(guild_id, set())
+
+    def reason_for(self, guild_id: int, user_id: int) -> str:
+        if user_id in self.global_bans:
+            return self.global_bans[user_id] or "Global banned by bot owner."
+        return "Hard banned by bot owner."
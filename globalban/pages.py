@@ -0,0 +1,136 @@
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import discord
+from redbot.core import commands
+from redbot.core.utils.menus import DEFAULT_CONTROLS, menu
+from redbot.vendored.discord.ext import menus
+
+Page = Union[str, discord.Embed]
+
+
+def chunk_lines(lines: Sequence[str], page_length: int = 1500) -> List[Tuple[int, int]]:
+    """Split lines into ``(start, end)`` slices whose joined text fits in ``page_length``."""
+    bounds: List[Tuple[int, int]] = []
+    start = 0
+    size = 0
+    for idx, line in enumerate(lines):
+        if size and size + len(line) > page_length:
+            bounds.append((start, idx))
+            start = idx
+            size = 0
+        size += len(line)
+    if start < len(lines):
+        bounds.append((start, len(lines)))
+    return bounds
+
+
+class LazyPages(menus.PageSource):
+    """Page source that only renders a page the first time it is shown."""
+
+    def __init__(self, page_count: int, render: Callable[[int], Awaitable[Page]]):
+        self.page_count: int = page_count
+        self.render = render
+        self._rendered: Dict[int, Page] = {}
+
+    def is_paginating(self) -> bool:
+        return self.page_count > 1
+
+    def get_max_pages(self) -> int:
+        return self.page_count
+
+    async def get_page(self, page_number: int) -> Page:
+        if not -self.page_count <= page_number < self.page_count:
+            raise IndexError(page_number)
+        page_number %= self.page_count
+        if page_number not in self._rendered:
+            self._rendered[page_number] = await self.render(page_number)
+        return self._rendered[page_number]
+
+    async def format_page(self, menu, page: Page) -> Page:
+        return page
+
+
+def _message_kwargs(page: Page) -> Dict[str, Any]:
+    if isinstance(page, discord.Embed):
+        return {"content": None, "embed": page}
+    return {"content": page, "embed": None}
+
+
+if discord.version_info.major >= 2:
+
+    class LazyMenu(discord.ui.View):
+        """Buttons to page through ``LazyPages``, only the command's author can use them."""
+
+        def __init__(self, ctx: commands.Context, source: LazyPages, *, timeout: float = 180.0):
+            super().__init__(timeout=timeout)
+            self.ctx: commands.Context = ctx
+            self.source: LazyPages = source
+            self.current: int = 0
+            self.message: Optional[discord.Message] = None
+            if not source.is_paginating():
+                self.clear_items()
+
+        async def start(self) -> None:
+            page = await self.source.get_page(0)
+            self.message = await self.ctx.send(
+                **_message_kwargs(page), view=self if self.children else None
+            )
+
+        async def interaction_check(self, interaction: discord.Interaction) -> bool:
+            if interaction.user.id == self.ctx.author.id:
+                return True
+            await interaction.response.send_message(
+                "You're not the author of this message.", ephemeral=True
+            )
+            return False
+
+        async def on_timeout(self) -> None:
+            if self.message is None:
+                return
+            try:
+                await self.message.edit(view=None)
+            except discord.HTTPException:
+                pass
+
+        async def _show(self, interaction: discord.Interaction, page_number: int) -> None:
+            # rendering a page may take longer than Discord waits for a response
+            await interaction.response.defer()
+            self.current = page_number % self.source.get_max_pages()
+            page = await self.source.get_page(self.current)
+            await interaction.message.edit(**_message_kwargs(page), view=self)
+
+        @discord.ui.button(emoji="\N{BLACK LEFT-POINTING DOUBLE TRIANGLE WITH VERTICAL BAR}")
+        async def first_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+            await self._show(interaction, 0)
+
+        @discord.ui.button(emoji="\N{BLACK LEFT-POINTING TRIANGLE}")
+        async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+            await self._show(interaction, self.current - 1)
+
+        @discord.ui.button(emoji="\N{HEAVY MULTIPLICATION X}", style=discord.ButtonStyle.red)
+        async def close(self, interaction: discord.Interaction, button: discord.ui.Button):
+            self.stop()
+            await interaction.response.defer()
+            try:
+                await interaction.message.delete()
+            except discord.HTTPException:
+                pass
+
+        @discord.ui.button(emoji="\N{BLACK RIGHT-POINTING TRIANGLE}")
+        async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+            await self._show(interaction, self.current + 1)
+
+        @discord.ui.button(emoji="\N{BLACK RIGHT-POINTING DOUBLE TRIANGLE WITH VERTICAL BAR}")
+        async def last_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+            await self._show(interaction, -1)
+
+
+async def lazy_menu(ctx: commands.Context, source: LazyPages) -> None:
+    if source.get_max_pages() == 0:
+        return
+    if discord.version_info.major >= 2:
+        await LazyMenu(ctx, source).start()
+        return
+    # discord.py 1.x has no views, Red's reaction menu needs every page up front
+    pages = [await source.get_page(idx) for idx in range(source.get_max_pages())]
+    await menu(ctx, pages, DEFAULT_CONTROLS)
@@ -0,0 +1,67 @@
+import asyncio
+from logging import getLogger
+from typing import AsyncIterator, Callable, Set
+
+import discord
+
+from .transfer import BULK_BAN_SIZE, ban_all
+
+logger = getLogger("red.dia.GlobalBan")
+
+# seconds to wait between two ban requests of reconciliation, and between two guilds
+BAN_DELAY: float = 1.0
+GUILD_DELAY: float = 2.0
+
+
+async def _iter_bans(guild: discord.Guild) -> AsyncIterator[discord.User]:
+    if discord.version_info.major >= 2:
+        async for entry in guild.bans(limit=None):
+            yield entry.user
+    else:
+        # discord.py 1.x returns the whole list at once
+        for entry in await guild.bans():
+            yield entry.user
+
+
+async def reconcile_guild(
+    guild: discord.Guild,
+    expected: Set[int],
+    reason_for: Callable[[int], str],
+    can_ban: Callable[[int], bool],
+) -> int:
+    """Ban every user in ``expected`` that isn't banned in the guild yet.
+
+    Users ``can_ban`` rejects are left out. The guild's ban list is streamed page
+    by page and stops as soon as every expected user has been seen. The missing
+    users are then banned in bulk, ``BULK_BAN_SIZE`` at a time; a failed request is
+    logged and skipped. Returns how many users were banned.
+    """
+    if not expected or not guild.me.guild_permissions.ban_members:
+        return 0
+    missing = {user_id for user_id in expected if can_ban(user_id)}
+    if not missing:
+        return 0
+    async for user in _iter_bans(guild):
+        missing.discard(user.id)
+        if not missing:
+            return 0
+    user_ids = sorted(missing)
+    applied = 0
+    for idx in range(0, len(user_ids), BULK_BAN_SIZE):
+        chunk = user_ids[idx : idx + BULK_BAN_SIZE]
+        try:
+            await ban_all(
+                guild,
+                chunk,
+                reason="Reconciling global and hard bans.",
+                done={},
+                reason_for=reason_for,
+            )
+        except discord.HTTPException as e:
+            logger.warning(f"Couldn't ban {len(chunk)} users in {guild.name}/{guild.id}: {e}")
+        else:
+            applied += len(chunk)
+        await asyncio.sleep(BAN_DELAY)
+    if applied:
+        logger.info("Applied %s missing bans in %s/%s.", applied, guild.name, guild.id)
+    return applied
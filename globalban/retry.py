@@ -0,0 +1,234 @@
+import asyncio
+import random
+import time
+from logging import getLogger
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import discord
+from redbot.core.bot import Red
+from redbot.core.config import Group
+
+from .fanout import TRANSPORT_ERRORS, is_transient
+from .transfer import ban_all
+
+logger = getLogger("red.dia.GlobalBan")
+
+# delay before the first retry, doubled on every failure up to MAX_DELAY
+BASE_DELAY: float = 60.0
+MAX_DELAY: float = 6 * 60 * 60.0
+MAX_ATTEMPTS: int = 10
+# seconds to wait between two retried requests
+JOB_DELAY: float = 1.0
+
+
+def _job_key(guild_id: int, user_id: int) -> str:
+    return f"{guild_id}-{user_id}"
+
+
+def _describe(job: Dict[str, Any]) -> str:
+    user_ids = job["user_ids"]
+    users = user_ids[0] if len(user_ids) == 1 else f"{len(user_ids)} users"
+    return f"{job['action']} of {users} in {job['guild_id']}"
+
+
+def _backoff(attempts: int, error: Optional[Exception]) -> float:
+    delay = min(MAX_DELAY, BASE_DELAY * 2 ** (attempts - 1))
+    # full jitter keeps retries of one failed fan-out from hitting Discord all at once
+    delay = delay / 2 + random.uniform(0, delay / 2)
+    response = getattr(error, "response", None)
+    if response is not None and getattr(response, "headers", None) is not None:
+        try:
+            delay = max(delay, float(response.headers.get("Retry-After", 0)))
+        except ValueError:
+            pass
+    return delay
+
+
+class RetryQueue:
+    """Persisted queue of bans and unbans that failed in a guild for a transient reason.
+
+    A job holds one user, or every user of an import a guild hadn't got to yet, which
+    is replayed in bulk. There is at most one single-user job per guild and user, a
+    newer action for a user replaces their pending ones. Jobs are written to Config
+    one at a time, so they survive restarts without rewriting the whole queue.
+    """
+
+    def __init__(
+        self,
+        bot: Red,
+        group: Group,
+        *,
+        reason_for: Callable[[int], Optional[str]] = lambda user_id: None,
+    ):
+        self.bot: Red = bot
+        self.group: Group = group
+        # reason of a user's own ban, used when a bulk job falls back to single bans
+        self.reason_for: Callable[[int], Optional[str]] = reason_for
+        # key -> {guild_id, user_ids, action, reason, attempts, next_try, bulk}
+        # keys are "guild_id-user_id" for a single user and "guild_id-import-n" for bulk jobs
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self._wakeup: asyncio.Event = asyncio.Event()
+
+    async def load(self) -> None:
+        self.jobs = await self.group()
+        for job in self.jobs.values():
+            # jobs queued by older versions held a single user_id
+            if "user_id" in job:
+                job["user_ids"] = [job.pop("user_id")]
+
+    async def _save_job(self, key: str) -> None:
+        job = self.jobs.get(key)
+        if job is None:
+            await self.group.clear_raw(key)
+        else:
+            await self.group.set_raw(key, value=job)
+
+    async def _drop_users(self, user_ids: Iterable[int]) -> None:
+        """Take users out of every pending job, a newer action replaces them."""
+        user_ids = set(user_ids)
+        for key, job in list(self.jobs.items()):
+            if user_ids.isdisjoint(job["user_ids"]):
+                continue
+            job["user_ids"] = [user_id for user_id in job["user_ids"] if user_id not in user_ids]
+            if not job["user_ids"]:
+                del self.jobs[key]
+            await self._save_job(key)
+
+    def _add(
+        self,
+        key: str,
+        guild_id: int,
+        user_ids: List[int],
+        action: str,
+        reason: Optional[str],
+        bulk: bool = False,
+    ) -> None:
+        self.jobs[key] = {
+            "guild_id": guild_id,
+            "user_ids": user_ids,
+            "action": action,
+            "reason": reason,
+            "attempts": 0,
+            "next_try": time.time() + BASE_DELAY,
+            "bulk": bulk,
+        }
+
+    async def schedule(
+        self, user_id: int, action: str, reason: Optional[str], guilds: Iterable[discord.Guild]
+    ) -> None:
+        """Queue ``action`` for a user in ``guilds``, dropping the user's other pending jobs.
+
+        ``action`` is either ``"ban"`` or ``"unban"``.
+        """
+        await self._drop_users([user_id])
+        for guild in guilds:
+            key = _job_key(guild.id, user_id)
+            self._add(key, guild.id, [user_id], action, reason)
+            await self._save_job(key)
+        self._wakeup.set()
+
+    async def schedule_bulk(
+        self, reason: Optional[str], pending: Dict[discord.Guild, List[int]]
+    ) -> None:
+        """Queue one bulk ban job per guild, ``pending`` maps guilds to the users left there.
+
+        ``reason`` goes to the bulk requests, single bans use the user's own reason.
+        """
+        pending = {guild: user_ids for guild, user_ids in pending.items() if user_ids}
+        await self._drop_users({user_id for user_ids in pending.values() for user_id in user_ids})
+        for guild, user_ids in pending.items():
+            key = f"{guild.id}-import-{time.time_ns()}"
+            self._add(key, guild.id, list(user_ids), "ban", reason, bulk=True)
+            await self._save_job(key)
+        self._wakeup.set()
+
+    async def drop_guild(self, guild_id: int) -> None:
+        for key in [key for key, job in self.jobs.items() if job["guild_id"] == guild_id]:
+            del self.jobs[key]
+            await self._save_job(key)
+
+    async def run(self) -> None:
+        await self.bot.wait_until_red_ready()
+        while True:
+            self._wakeup.clear()
+            now = time.time()
+            due = [key for key, job in self.jobs.items() if job["next_try"] <= now]
+            for key in due:
+                try:
+                    await self._attempt(key)
+                except Exception:
+                    logger.exception(f"Retrying job {key} failed")
+                    self._reschedule(key)
+                try:
+                    await self._save_job(key)
+                except Exception:
+                    logger.exception(f"Failed to save retry job {key}")
+                await asyncio.sleep(JOB_DELAY)
+            timeout = None
+            if self.jobs:
+                next_try = min(job["next_try"] for job in self.jobs.values())
+                timeout = max(0.0, next_try - time.time())
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _attempt(self, key: str) -> None:
+        job = self.jobs.get(key)
+        if job is None:
+            return
+        guild = self.bot.get_guild(job["guild_id"])
+        if guild is None:
+            # the bot left the guild
+            del self.jobs[key]
+            return
+        user_ids = job["user_ids"]
+        done: Dict[int, int] = {}
+        try:
+            if job.get("bulk"):
+                await ban_all(
+                    guild, user_ids, reason=job["reason"], done=done, reason_for=self.reason_for
+                )
+            elif job["action"] == "ban":
+                await guild.ban(discord.Object(id=user_ids[0]), reason=job["reason"])
+            else:
+                await guild.unban(discord.Object(id=user_ids[0]), reason=job["reason"])
+        except discord.NotFound:
+            # unknown user, or nothing left to unban
+            self._finish(key, job)
+        except (discord.HTTPException, *TRANSPORT_ERRORS) as e:
+            if self.jobs.get(key) is not job:
+                return
+            # a bulk job continues after the users already banned, minus any dropped meanwhile
+            remaining = set(job["user_ids"])
+            job["user_ids"] = [
+                user_id for user_id in user_ids[done.get(guild.id, 0) :] if user_id in remaining
+            ]
+            if not job["user_ids"]:
+                del self.jobs[key]
+                return
+            job["attempts"] += 1
+            if not is_transient(e) or job["attempts"] >= MAX_ATTEMPTS:
+                logger.warning(f"Giving up on {_describe(job)}: {e}")
+                del self.jobs[key]
+                return
+            job["next_try"] = time.time() + _backoff(job["attempts"], e)
+        else:
+            self._finish(key, job)
+
+    def _reschedule(self, key: str) -> None:
+        """Push back a job whose attempt raised unexpectedly, so it can't be retried in a loop."""
+        job = self.jobs.get(key)
+        if job is None:
+            return
+        job["attempts"] += 1
+        if job["attempts"] >= MAX_ATTEMPTS:
+            logger.warning(f"Giving up on {_describe(job)}")
+            del self.jobs[key]
+            return
+        job["next_try"] = time.time() + _backoff(job["attempts"], None)
+
+    def _finish(self, key: str, job: Dict[str, Any]) -> None:
+        # the job may have been replaced by a newer action while the request was in flight
+        if self.jobs.get(key) is job:
+            del self.jobs[key]
@@ -0,0 +1,72 @@
+import asyncio
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS global_bans (
+    user_id INTEGER PRIMARY KEY,
+    reason TEXT
+)
+"""
+
+
+class BanStore:
+    """Global ban records kept in SQLite.
+
+    ``user_id`` is the table's primary key, so inserts, deletes and lookups are
+    B-tree operations instead of rewriting a JSON document. Every call runs on a
+    single worker thread that owns the connection.
+    """
+
+    def __init__(self, path: Path):
+        self.path: Path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="globalban-store")
+        self._conn: Optional[sqlite3.Connection] = None
+
+    async def _run(self, func: Callable[..., Any], *args: Any) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, partial(func, *args)
+        )
+
+    async def open(self) -> None:
+        await self._run(self._open)
+
+    def _open(self) -> None:
+        self._conn = sqlite3.connect(str(self.path))
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(_SCHEMA)
+        self._conn.commit()
+
+    async def close(self) -> None:
+        if self._conn is not None:
+            await self._run(self._conn.close)
+            self._conn = None
+        self._executor.shutdown(wait=False)
+
+    async def load(self) -> Dict[int, Optional[str]]:
+        return await self._run(self._load)
+
+    def _load(self) -> Dict[int, Optional[str]]:
+        return dict(self._conn.execute("SELECT user_id, reason FROM global_bans"))
+
+    async def add(self, user_id: int, reason: Optional[str]) -> None:
+        await self.add_many([(user_id, reason)])
+
+    async def add_many(self, bans: Iterable[Tuple[int, Optional[str]]]) -> None:
+        await self._run(self._add_many, list(bans))
+
+    def _add_many(self, bans: Iterable[Tuple[int, Optional[str]]]) -> None:
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO global_bans (user_id, reason) VALUES (?, ?)", bans
+            )
+
+    async def remove(self, user_id: int) -> None:
+        await self._run(self._remove, user_id)
+
+    def _remove(self, user_id: int) -> None:
+        with self._conn:
+            self._conn.execute("DELETE FROM global_bans WHERE user_id = ?", (user_id,))
@@ -0,0 +1,75 @@
+import csv
+import io
+import json
+from typing import Callable, Dict, List, Optional, Tuple
+
+import discord
+
+FORMATS: Tuple[str, ...] = ("jsonl", "csv")
+CSV_HEADER: str = "user_id,reason\n"
+
+# discord.py's bulk_ban accepts at most this many users per request
+BULK_BAN_SIZE: int = 200
+
+
+def format_ban(user_id: int, reason: Optional[str], fmt: str) -> str:
+    """One exported line, newline included."""
+    if fmt == "jsonl":
+        return json.dumps({"user_id": user_id, "reason": reason}) + "\n"
+    buffer = io.StringIO()
+    # the importer reads one line per row, so reasons are kept on a single line
+    csv.writer(buffer, lineterminator="\n").writerow(
+        [user_id, (reason or "").replace("\r", " ").replace("\n", " ")]
+    )
+    return buffer.getvalue()
+
+
+def parse_ban(line: str, fmt: str) -> Optional[Tuple[int, Optional[str]]]:
+    """Parse one imported line into ``(user_id, reason)``.
+
+    Returns None for blank lines and the CSV header, raises ValueError, KeyError,
+    TypeError or IndexError for malformed lines. JSON lines may also be bare IDs.
+    """
+    line = line.strip()
+    if not line:
+        return None
+    if fmt == "jsonl":
+        data = json.loads(line)
+        if isinstance(data, (int, str)):
+            return int(data), None
+        return int(data["user_id"]), data.get("reason") or None
+    row = next(csv.reader([line]))
+    if row[0].strip() == "user_id":
+        return None
+    return int(row[0]), (row[1] or None) if len(row) > 1 else None
+
+
+async def ban_all(
+    guild: discord.Guild,
+    user_ids: List[int],
+    *,
+    reason: str,
+    done: Dict[int, int],
+    reason_for: Callable[[int], Optional[str]] = lambda user_id: None,
+) -> None:
+    """Ban every user in a guild, in bulk when discord.py supports it.
+
+    A bulk request takes a single ``reason``, users banned one by one get their own
+    reason from ``reason_for`` when it has one. Unknown users are skipped. ``done``
+    maps guild IDs to how many users were already handled, so a retried call
+    continues where the previous attempt stopped.
+    """
+    start = done.get(guild.id, 0)
+    if hasattr(guild, "bulk_ban"):
+        for idx in range(start, len(user_ids), BULK_BAN_SIZE):
+            chunk = user_ids[idx : idx + BULK_BAN_SIZE]
+            await guild.bulk_ban([discord.Object(id=user_id) for user_id in chunk], reason=reason)
+            done[guild.id] = idx + len(chunk)
+        return
+    for idx in range(start, len(user_ids)):
+        user_id = user_ids[idx]
+        try:
+            await guild.ban(discord.Object(id=user_id), reason=reason_for(user_id) or reason)
+        except discord.NotFound:
+            pass
+        done[guild.id] = idx + 1
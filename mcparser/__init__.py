@@ -1,16 +1,34 @@
+import asyncio
+import codecs
 import re
-from typing import List, Pattern, Union
+from logging import getLogger
+from typing import Dict, List, Pattern, Tuple, Union
 
 import aiohttp
 import discord
 from redbot.core import Config, commands
 from redbot.core.bot import Red
-from redbot.core.utils.chat_formatting import pagify
+from redbot.core.utils.chat_formatting import humanize_number, pagify
 from redbot.core.utils.menus import DEFAULT_CONTROLS, menu
 
-from .parsers import custom_log_parser, parse_all
+from .cache import ResultCache
+from .matcher import Matcher
+from .parsers import build_matcher
+from .pool import ScanPool
+
+log = getLogger("red.dia.McParser")
 
 guild_config = {"channels": [], "custom_logs": {}}
+# logs are read up to max_log_size bytes, anything past that is ignored
+global_config = {"max_log_size": 20 * 1024 * 1024}
+
+CHUNK_SIZE: int = 64 * 1024
+# regexes are always searched in worker processes, up to this many bytes a log goes
+# there chunk by chunk, the rest in pieces of OFFLOAD_BATCH_SIZE
+OFFLOAD_THRESHOLD: int = 2 * 1024 * 1024
+OFFLOAD_BATCH_SIZE: int = 1024 * 1024
+
+PASTE_REGEX: Pattern = re.compile(r"https:/{2}paste.ee/p/[^\s/]+")
 
 
 class McParser(commands.Cog):
@@ -26,20 +44,29 @@ class McParser(commands.Cog):
         self.config = Config.get_conf(self, identifier=0xEAA1E2D8001000, force_registration=True)
         self.channels = {}
         self.customs = {}
+        # guild id -> compiled rules, dropped whenever the guild's custom parsers change
+        self.matchers: Dict[int, Matcher] = {}
+        self.results: ResultCache = ResultCache()
         self.session = aiohttp.ClientSession()
+        self.pool: ScanPool = ScanPool()
         self.config.register_guild(**guild_config)
+        self.config.register_global(**global_config)
+        self.max_log_size: int = global_config["max_log_size"]
 
     if discord.version_info.major >= 2:
 
         async def cog_unload(self) -> None:
+            self.pool.shutdown()
             await self.session.close()
 
     else:
 
         def cog_unload(self) -> None:
+            self.pool.shutdown()
             self.bot.loop.create_task(self.session.close())
 
     async def initialize(self) -> None:
+        self.max_log_size = await self.config.max_log_size()
         data = await self.config.all_guilds()
         for guild_id, guild_data in data.items():
             self.channels[int(guild_id)] = guild_data["channels"]
@@ -51,6 +78,63 @@ class McParser(commands.Cog):
         pre_processed = super().format_help_for_context(ctx)
         return f"{pre_processed}\nAuthor: {self.__author__}"
 
+    def rule_scope(self, guild_id: int) -> int:
+        """Key of the rules a guild uses, guilds without custom parsers share the built-in ones."""
+        return guild_id if self.customs.get(guild_id) else 0
+
+    def get_matcher(self, guild_id: int) -> Matcher:
+        """The guild's built-in and custom rules, compiled on first use."""
+        if guild_id not in self.matchers:
+            self.matchers[guild_id] = build_matcher(self.customs.get(guild_id))
+        return self.matchers[guild_id]
+
+    async def scan_log(self, url: str, matcher: Matcher) -> Union[Tuple[List[str], bool], None]:
+        """Stream a log through the matcher, returning its findings and whether it was cut short.
+
+        Reading stops at ``max_log_size`` bytes or as soon as nothing further in the
+        log could change the result, so memory use doesn't depend on the log's size.
+        Returns None when the paste couldn't be downloaded or scanned in time.
+        """
+        scan = matcher.scan()
+        truncated = False
+        async with self.session.get(url) as r:
+            if r.status != 200:
+                return None
+            try:
+                decoder = codecs.getincrementaldecoder(r.charset or "utf-8")(errors="replace")
+            except LookupError:
+                decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+            size = 0
+            # text waiting to be sent to the worker processes
+            pending: List[str] = []
+            pending_size = 0
+            try:
+                async for chunk in r.content.iter_chunked(CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > self.max_log_size:
+                        chunk = chunk[: len(chunk) - (size - self.max_log_size)]
+                        truncated = True
+                    text = decoder.decode(chunk)
+                    if size <= OFFLOAD_THRESHOLD:
+                        await self.pool.feed(scan, text)
+                    else:
+                        pending.append(text)
+                        pending_size += len(chunk)
+                        if pending_size >= OFFLOAD_BATCH_SIZE or truncated:
+                            await self.pool.feed(scan, "".join(pending))
+                            pending.clear()
+                            pending_size = 0
+                    if truncated or scan.done:
+                        break
+                else:
+                    pending.append(decoder.decode(b"", final=True))
+                # what's left is less than a batch
+                await self.pool.feed(scan, "".join(pending))
+                return await self.pool.finish(scan), truncated
+            except asyncio.TimeoutError:
+                log.warning("Gave up on %s, scanning it took too long.", url)
+                return None
+
     async def red_delete_data_for_user(self, *, requester: str, user_id: int) -> None:
         return
 
@@ -62,14 +146,19 @@ class McParser(commands.Cog):
             return
         if message.channel.id not in self.channels.get(message.guild.id, []):
             return
-        regex: Pattern = re.compile(r"https:/{2}paste.ee/p/[^\s/]+")
-        if found := regex.search(message.content):
-            async with self.session.get(str(found.group()).replace("/p/", "/r/")) as r:
-                log = await r.text()
-            data = parse_all(log)
-            if self.customs.get(message.guild.id, None):
-                if custom := custom_log_parser(self.customs[message.guild.id], log):
-                    data.extend(custom)
+        if found := PASTE_REGEX.search(message.content):
+            # pastes can't be edited, so a paste ID always stands for the same content
+            paste_id = found.group().rsplit("/", 1)[-1]
+            scope = self.rule_scope(message.guild.id)
+            cached = self.results.get(scope, paste_id)
+            if cached is None:
+                cached = await self.scan_log(
+                    str(found.group()).replace("/p/", "/r/"), self.get_matcher(message.guild.id)
+                )
+                if cached is None:
+                    return
+                self.results.put(scope, paste_id, *cached)
+            data, truncated = cached
             if len(data) != 0:
                 embed = discord.Embed(
                     title="Automated Response: (Warning: Experimental)",
@@ -81,9 +170,12 @@ class McParser(commands.Cog):
                         value=x.replace(x.split()[0], ""),
                         inline=False,
                     )
+                footer = f"This might not solve your problem, but it could be worth a try.\nTriggered by: {str(message.author)}"
+                if truncated:
+                    footer += f"\nOnly the first {humanize_number(self.max_log_size)} bytes of the log were checked."
                 embed.set_footer(
                     icon_url=self.get_avatar_url(self.bot.user),
-                    text=f"This might not solve your problem, but it could be worth a try.\nTriggered by: {str(message.author)}",
+                    text=footer,
                 )
                 await message.channel.send(embed=embed)
 
@@ -135,6 +227,37 @@ class McParser(commands.Cog):
             )
         )
 
+    @minecraftparser.command(name="maxsize")
+    @commands.is_owner()
+    async def minecraftparser_maxsize(self, ctx: commands.Context, size: int) -> None:
+        """Set how many bytes of a log are read at most"""
+        if size < 1:
+            await ctx.send("Size must be positive.")
+            return
+        self.max_log_size = size
+        await self.config.max_log_size.set(size)
+        # results of logs cut at the old size don't hold anymore
+        self.results.clear()
+        await ctx.send(f"Logs will be read up to {humanize_number(size)} bytes.")
+
+    @minecraftparser.command(name="cache")
+    @commands.is_owner()
+    async def minecraftparser_cache(self, ctx: commands.Context, clear: bool = False) -> None:
+        """Show how often parse results were reused
+
+        Pass `true` to clear the cache afterwards.
+        """
+        stats = self.results.snapshot()
+        lookups = stats.get("hits", 0) + stats.get("misses", 0)
+        await ctx.send(
+            f"Cached results: {stats['entries']}/{self.results.max_entries}\n"
+            f"Hits: {stats.get('hits', 0)}, misses: {stats.get('misses', 0)} "
+            f"({stats.get('hits', 0) / (lookups or 1):.0%} hit rate)\n"
+            f"Expired: {stats.get('expired', 0)}, evicted: {stats.get('evicted', 0)}"
+        )
+        if clear:
+            self.results.clear()
+
     @minecraftparser.group(name="custom")
     async def minecraftparser_custom(self, ctx: commands.Context) -> None:
         """Custom Minecraft Parser"""
@@ -147,6 +270,8 @@ class McParser(commands.Cog):
         if not self.customs.get(ctx.guild.id):
             self.customs[ctx.guild.id] = {}
         self.customs[ctx.guild.id][solve] = trigger
+        self.matchers.pop(ctx.guild.id, None)
+        self.results.invalidate(ctx.guild.id)
         async with self.config.guild(ctx.guild).custom_logs() as custom:
             custom[solve] = trigger
         await ctx.send("Custom parser added.")
@@ -191,6 +316,8 @@ class McParser(commands.Cog):
             )
             return
         del self.customs[ctx.guild.id][parser]
+        self.matchers.pop(ctx.guild.id, None)
+        self.results.invalidate(ctx.guild.id)
         async with self.config.guild(ctx.guild).custom_logs() as custom:
             del custom[parser]
         await ctx.send("Custom log parser removed.")
@@ -0,0 +1,60 @@
+import time
+from collections import Counter, OrderedDict
+from typing import Dict, List, Tuple, Union
+
+# findings and whether the log was cut short by the size cap
+CachedResult = Tuple[List[str], bool]
+
+
+class ResultCache:
+    """Remembers what was found in recently parsed pastes.
+
+    Entries are keyed by the rule scope (a guild ID, or 0 for the built-in rules
+    shared by every guild without custom parsers) and the paste ID. Only the
+    findings are kept, never the log, and the least recently used entries are
+    dropped past ``max_entries``.
+    """
+
+    def __init__(self, *, max_entries: int = 512, ttl: float = 3600):
+        self.max_entries: int = max_entries
+        self.ttl: float = ttl
+        # (scope, paste id) -> (expiry, findings, truncated)
+        self._entries: "OrderedDict[Tuple[int, str], Tuple[float, List[str], bool]]" = (
+            OrderedDict()
+        )
+        self.stats: Counter = Counter()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, scope: int, paste_id: str) -> Union[CachedResult, None]:
+        key = (scope, paste_id)
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+                self.stats["expired"] += 1
+            self.stats["misses"] += 1
+            return None
+        self._entries.move_to_end(key)
+        self.stats["hits"] += 1
+        return entry[1], entry[2]
+
+    def put(self, scope: int, paste_id: str, findings: List[str], truncated: bool) -> None:
+        key = (scope, paste_id)
+        self._entries[key] = (time.monotonic() + self.ttl, findings, truncated)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats["evicted"] += 1
+
+    def invalidate(self, scope: int) -> None:
+        """Forget every result parsed with a scope's rules."""
+        for key in [key for key in self._entries if key[0] == scope]:
+            del self._entries[key]
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def snapshot(self) -> Dict[str, int]:
+        return {"entries": len(self._entries), **self.stats}
@@ -0,0 +1,212 @@
+import re
+from typing import Callable, Dict, Iterable, List, Match, NamedTuple, Pattern, Set, Tuple, Union
+
+# longest piece of a single line kept between two chunks of a streamed log, longer
+# lines are cut from the front so a log without newlines can't grow the buffer
+MAX_LINE_LENGTH: int = 64 * 1024
+
+
+class Rule(NamedTuple):
+    """One log check and the response it produces.
+
+    The rule applies when every literal in ``all_of`` occurs in the log and, if
+    ``any_of`` isn't empty, at least one of those does too. Rules with a ``pattern``
+    also need the regex to match; it is only searched once the literals matched,
+    also in streamed logs, so every literal of a regex rule must occur within each
+    match of its pattern.
+    Patterns may only span lines through an explicit newline escape, streamed logs are
+    searched line by line, and may not use anchors or lookarounds, a match is
+    rebuilt by searching its own text again.
+    ``render`` receives the message and the regex match and may return a different
+    message, or None to stay silent.
+    """
+
+    message: str
+    all_of: Tuple[str, ...] = ()
+    any_of: Tuple[str, ...] = ()
+    pattern: Union[str, None] = None
+    render: Union[Callable[[str, Match], Union[str, None]], None] = None
+
+
+class Matcher:
+    """Checks a set of rules against a log.
+
+    Every distinct literal of every rule is looked up once, however many rules
+    share it, and the rules are then decided from the set of literals found.
+    """
+
+    def __init__(self, rules: Iterable[Rule]):
+        self.rules: List[Rule] = list(rules)
+        self.literals: Tuple[str, ...] = tuple(
+            dict.fromkeys(literal for rule in self.rules for literal in rule.all_of + rule.any_of)
+        )
+        self.patterns: Dict[str, Pattern] = {
+            rule.pattern: re.compile(rule.pattern) for rule in self.rules if rule.pattern
+        }
+        # pattern -> the rules using it
+        self.pattern_rules: Dict[str, List[Rule]] = {}
+        for rule in self.rules:
+            if rule.pattern:
+                self.pattern_rules.setdefault(rule.pattern, []).append(rule)
+        # the most lines a single pattern can match across
+        self.line_span: int = 1 + max(
+            (pattern.count("\\n") for pattern in self.patterns), default=0
+        )
+
+    def hits(self, log: str) -> Set[str]:
+        return {literal for literal in self.literals if literal in log}
+
+    @staticmethod
+    def literals_match(rule: Rule, hits: Set[str]) -> bool:
+        if not all(literal in hits for literal in rule.all_of):
+            return False
+        return not rule.any_of or any(literal in hits for literal in rule.any_of)
+
+    def gated(self, hits: Set[str]) -> Tuple[str, ...]:
+        """Patterns of the rules whose literals were all found, the only ones worth searching."""
+        return tuple(
+            pattern
+            for pattern, rules in self.pattern_rules.items()
+            if any(self.literals_match(rule, hits) for rule in rules)
+        )
+
+    def evaluate(self, hits: Set[str], search: Callable[[str], Union[Match, None]]) -> List[str]:
+        """Decide every rule from the literals found, ``search`` gives a pattern's first match."""
+        result: List[str] = []
+        for rule in self.rules:
+            if not self.literals_match(rule, hits):
+                continue
+            if rule.pattern is None:
+                result.append(rule.message)
+                continue
+            found = search(rule.pattern)
+            if found is None:
+                continue
+            message = rule.render(rule.message, found) if rule.render else rule.message
+            if message:
+                result.append(message)
+        return result
+
+    def match(self, log: str) -> List[str]:
+        """Messages of every rule that applies, in rule order."""
+        return self.evaluate(self.hits(log), lambda pattern: self.patterns[pattern].search(log))
+
+    def resolved(self, hits: Set[str], found: Dict[str, Match]) -> bool:
+        """Whether every rule already applies, so the rest of a log can't change the result."""
+        for rule in self.rules:
+            if not self.literals_match(rule, hits):
+                return False
+            if rule.pattern is not None and rule.pattern not in found:
+                return False
+        return True
+
+    def scan(self) -> "Scan":
+        return Scan(self)
+
+
+def scan_piece(
+    literals: Tuple[str, ...], patterns: Tuple[str, ...], window: str, lines: str
+) -> Tuple[Set[str], Dict[str, str]]:
+    """Literals found in ``window`` and the text of each pattern's first match in ``lines``.
+
+    Only takes and returns plain data, so it can run in another process.
+    """
+    hits = {literal for literal in literals if literal in window}
+    found: Dict[str, str] = {}
+    for pattern in patterns:
+        match = re.search(pattern, lines)
+        if match is not None:
+            found[pattern] = match.group()
+    return hits, found
+
+
+def _last_lines(text: str, count: int) -> str:
+    """The last ``count`` lines of text ending with a newline."""
+    end = len(text) - 1
+    for _ in range(count):
+        end = text.rfind("\n", 0, end)
+        if end == -1:
+            return text
+    return text[end + 1 :]
+
+
+class Scan:
+    """A matcher run over a log that arrives in pieces.
+
+    Literals are looked up in each piece plus the end of the previous one, so a
+    trigger split between two pieces still matches. Regexes are searched on whole
+    lines, together with as many previous lines as a pattern can span, and only
+    once their rule's literals were found up to the end of the piece. Only those
+    overlaps are kept between pieces, never the log itself.
+    """
+
+    def __init__(self, matcher: Matcher):
+        self.matcher: Matcher = matcher
+        self.hits: Set[str] = set()
+        # pattern -> its first match
+        self.found: Dict[str, Match] = {}
+        self._overlap: int = max(map(len, matcher.literals), default=1) - 1
+        self._tail: str = ""
+        # start of the line still being received
+        self._partial: str = ""
+        # complete lines a multi-line pattern may still need
+        self._context: str = ""
+
+    @property
+    def done(self) -> bool:
+        return self.matcher.resolved(self.hits, self.found)
+
+    def feed(self, text: str) -> None:
+        self.apply(*scan_piece(*self.take(text)))
+
+    def take(self, text: str) -> Tuple[Tuple[str, ...], Tuple[str, ...], str, str]:
+        """Move past ``text``, returning the arguments of the ``scan_piece`` call it needs.
+
+        ``feed`` is ``apply(*scan_piece(*take(text)))``, split so the regex search can
+        happen elsewhere. Literals are looked up right away, they decide which
+        patterns are searched.
+        """
+        window = self._tail + text
+        self.hits |= scan_piece(self._pending_literals(), (), window, "")[0]
+        self._tail = window[-self._overlap :] if self._overlap else ""
+        lines = self._partial + text
+        cut = lines.rfind("\n") + 1
+        complete = ""
+        if cut:
+            complete = self._context + lines[:cut]
+            if self.matcher.line_span > 1:
+                context = _last_lines(complete, self.matcher.line_span - 1)
+                self._context = context[-MAX_LINE_LENGTH * (self.matcher.line_span - 1) :]
+        self._partial = lines[cut:][-MAX_LINE_LENGTH:]
+        return (), self._pending_patterns(complete), window, complete
+
+    def _pending_literals(self) -> Tuple[str, ...]:
+        return tuple(literal for literal in self.matcher.literals if literal not in self.hits)
+
+    def _pending_patterns(self, lines: str) -> Tuple[str, ...]:
+        if not lines:
+            return ()
+        return tuple(
+            pattern for pattern in self.matcher.gated(self.hits) if pattern not in self.found
+        )
+
+    def apply(self, hits: Set[str], found: Dict[str, str]) -> None:
+        self.hits |= hits
+        for pattern, text in found.items():
+            if pattern not in self.found:
+                self.found[pattern] = self.matcher.patterns[pattern].search(text)
+
+    def take_rest(self) -> Union[Tuple[Tuple[str, ...], Tuple[str, ...], str, str], None]:
+        """Like ``take`` for the unfinished last line, None when there is none."""
+        if not self._partial:
+            return None
+        lines = self._context + self._partial
+        self._partial = ""
+        return (), self._pending_patterns(lines), "", lines
+
+    def finish(self) -> List[str]:
+        """Messages of every rule that applies to everything fed so far."""
+        rest = self.take_rest()
+        if rest is not None:
+            self.apply(*scan_piece(*rest))
+        return self.matcher.evaluate(self.hits, self.found.get)
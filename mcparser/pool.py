@@ -0,0 +1,106 @@
+import asyncio
+import multiprocessing
+import site
+from multiprocessing.pool import Pool
+from pathlib import Path
+from typing import Any, Dict, List, Set, Tuple, Union
+
+from .matcher import Scan, scan_piece
+
+ScanArgs = Tuple[Tuple[str, ...], Tuple[str, ...], str, str]
+
+
+def _resolve(future: asyncio.Future, result: Any = None, error: Any = None) -> None:
+    # the waiter may have timed out already
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+class ScanPool:
+    """Searches log regexes in worker processes, away from the event loop.
+
+    Literal lookups stay inline, they take linear time whatever the log holds. Every
+    worker is a single-process pool of its own, so one that doesn't finish a piece
+    within ``timeout`` can be terminated and replaced instead of staying busy for
+    the next logs. Workers are started on first use. Red doesn't put cog folders on
+    ``sys.path``, so each worker adds the folder this cog lives in before importing
+    anything.
+    """
+
+    def __init__(self, *, workers: int = 2, timeout: float = 30.0):
+        self.workers: int = workers
+        # seconds a single piece may take before the log is given up on
+        self.timeout: float = timeout
+        self._pools: Set[Pool] = set()
+        self._idle: Union[asyncio.Queue, None] = None
+
+    def _start_worker(self) -> Pool:
+        # forking a process that runs an event loop and open sockets isn't safe
+        pool = multiprocessing.get_context("spawn").Pool(
+            1,
+            initializer=site.addsitedir,
+            initargs=(str(Path(__file__).resolve().parents[1]),),
+        )
+        self._pools.add(pool)
+        return pool
+
+    def _stop_worker(self, pool: Pool) -> None:
+        self._pools.discard(pool)
+        # terminating waits for the process to exit, keep that off the event loop
+        asyncio.get_running_loop().run_in_executor(None, pool.terminate)
+
+    async def _acquire(self) -> Pool:
+        if self._idle is None:
+            self._idle = asyncio.Queue()
+            for _ in range(self.workers):
+                self._idle.put_nowait(self._start_worker())
+        return await self._idle.get()
+
+    async def _scan(self, args: ScanArgs) -> Tuple[Set[str], Dict[str, str]]:
+        literals, patterns, window, lines = args
+        if not patterns:
+            return scan_piece(literals, patterns, window, lines)
+        pool = await self._acquire()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        try:
+            pool.apply_async(
+                scan_piece,
+                args,
+                callback=lambda result: loop.call_soon_threadsafe(_resolve, future, result),
+                error_callback=lambda error: loop.call_soon_threadsafe(
+                    _resolve, future, None, error
+                ),
+            )
+            return await asyncio.wait_for(future, self.timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            # the worker would keep searching, take a fresh one instead
+            self._stop_worker(pool)
+            if self._idle is not None:
+                pool = self._start_worker()
+            raise
+        finally:
+            # unless the pool was shut down meanwhile
+            if self._idle is not None and pool in self._pools:
+                self._idle.put_nowait(pool)
+
+    async def feed(self, scan: Scan, text: str) -> None:
+        """Like ``scan.feed(text)``, raises asyncio.TimeoutError past the timeout."""
+        scan.apply(*await self._scan(scan.take(text)))
+
+    async def finish(self, scan: Scan) -> List[str]:
+        """Like ``scan.finish()``, raises asyncio.TimeoutError past the timeout."""
+        rest = scan.take_rest()
+        if rest is not None:
+            scan.apply(*await self._scan(rest))
+        return scan.finish()
+
+    def shutdown(self) -> None:
+        for pool in self._pools:
+            pool.terminate()
+        self._pools.clear()
+        self._idle = None